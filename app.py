@@ -1,43 +1,26 @@
+import time
+_startup_started = time.perf_counter()
+
 import os
 import io
-import zipfile
-import yt_dlp
-import imageio_ffmpeg
-from flask import Flask, render_template, redirect, url_for, request, flash, send_file, jsonify, session
+import json
+import shutil
+import itertools
+from flask import Flask, Response, render_template, redirect, url_for, request, flash, send_file, jsonify, session
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from werkzeug.exceptions import BadRequest
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
 import tempfile
 import uuid
-import whois
 import requests
-import holidays
 from datetime import datetime, timedelta
 from PIL import Image, ExifTags
-import numpy as np
-import img2pdf
-import fitz  # PyMuPDF
-from pillow_heif import register_heif_opener
-try:
-    import cairosvg
-except (ImportError, OSError):
-    cairosvg = None
-
-from pdf2docx import Converter as PDF2Docx
 
 import glob
-import time
-from apscheduler.schedulers.background import BackgroundScheduler
-
-try:
-    import moviepy.editor as mp
-except ImportError:
-    import moviepy as mp
-
-try:
-    from xhtml2pdf import pisa
-except (ImportError, OSError):
-    pisa = None
+from background_jobs import LeaderScheduler, read_leader
 
 try:
     import markdown
@@ -51,28 +34,50 @@ def render_markdown(text):
         return markdown.markdown(text)
     return markdown2.markdown(text)
 
-from docx import Document
 from functools import wraps
 import re
 import base64
 
-# Optional: NLP and CV for censorship
-try:
-    import spacy
-    nlp = spacy.load("de_core_news_sm")
-except:
-    nlp = None
-
-try:
-    import cv2
-except ImportError:
-    cv2 = None 
-
-register_heif_opener()
+# Heavy tool backends (yt-dlp, PyMuPDF, OpenCV, spaCy, ...) are
+# imported on first use through the lazy registry, see lazy_deps.py
+from lazy_deps import deps
+import migrations
+from identity_cache import IdentityCache
+from config_store import ConfigStore
+from shortlinks import SlugIndex, ClickCounter
+import polls
+import uploads
+import share_archive
+import blob_store
+import share_expiry
+from file_scan import ScanQueue
+from convert_jobs import ConvertJobs
+import converter
+import zip_stream
+import pdf_raster
+import media_transcode
+import word_clouds
+from word_cloud_layout import LayoutCache
+from live import LiveHub
+from ingest import IngestQueue
 
 # Initialize extensions
 db = SQLAlchemy()
 login_manager = LoginManager()
+system_config = ConfigStore(db, refresh_seconds=int(os.environ.get('CONFIG_REFRESH_SECONDS', 5)))
+slug_index = SlugIndex(db, system_config)
+
+# How long an interrupted share download can be resumed without counting again (public_server.py)
+DOWNLOAD_SESSION_WINDOW = timedelta(hours=float(os.environ.get('DOWNLOAD_SESSION_HOURS', 6)))
+SHARE_MODES = ('time', 'open', 'download')
+MAX_SHARE_HOURS = 24 * 365
+
+# PDF page rendering of the file converter (pdf_raster.py)
+CONVERT_PDF_DPI = pdf_raster.parse_dpi(os.environ.get('CONVERT_PDF_DPI'))
+CONVERT_RENDER_WORKERS = int(os.environ.get('CONVERT_RENDER_WORKERS', 0)) or os.cpu_count() or 1
+# Audio/video conversion (media_transcode.py); 0 threads: the render workers' share of the cores
+CONVERT_FFMPEG_THREADS = int(os.environ.get('CONVERT_FFMPEG_THREADS', 0))
+CONVERT_FFMPEG_PRESET = os.environ.get('CONVERT_FFMPEG_PRESET', media_transcode.DEFAULT_PRESET)
 
 # Configuration
 class Config:
@@ -101,8 +106,20 @@ class Shortlink(db.Model):
     target_url = db.Column(db.String(500), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    # Written in batches by ClickCounter, see shortlinks.py
+    click_count = db.Column(db.Integer, default=0)
+    last_clicked_at = db.Column(db.DateTime, nullable=True)
 
     user = db.relationship('User', backref=db.backref('shortlinks', lazy=True))
+    daily_clicks = db.relationship('ShortlinkDailyClicks', cascade="all, delete-orphan", lazy=True)
+
+class ShortlinkDailyClicks(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    shortlink_id = db.Column(db.Integer, db.ForeignKey('shortlink.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, default=0)
+
+    __table_args__ = (db.UniqueConstraint('shortlink_id', 'day', name='uq_shortlink_day'),)
 
 class Note(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -140,6 +157,7 @@ class Poll(db.Model):
     slug = db.Column(db.String(50), unique=True, nullable=False)
     allow_suggestions = db.Column(db.Boolean, default=False)
     anonymous_voting = db.Column(db.Boolean, default=False)
+    results_version = db.Column(db.Integer, default=0) # Bumped on every vote, see polls.py
 
     user = db.relationship('User', backref=db.backref('polls', lazy=True))
     options = db.relationship('PollOption', backref='poll', cascade="all, delete-orphan", lazy=True)
@@ -148,6 +166,7 @@ class PollOption(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     poll_id = db.Column(db.Integer, db.ForeignKey('poll.id'), nullable=False)
     text = db.Column(db.String(200), nullable=False)
+    vote_count = db.Column(db.Integer, default=0) # Maintained counter, see polls.py
     
     votes = db.relationship('PollVote', backref='option', cascade="all, delete-orphan", lazy=True)
 
@@ -165,9 +184,11 @@ class WordCloud(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     is_active = db.Column(db.Boolean, default=True)
+    version = db.Column(db.Integer, default=0) # Bumped on every submitted word
 
     user = db.relationship('User', backref=db.backref('word_clouds', lazy=True))
     entries = db.relationship('WordCloudEntry', backref='word_cloud', cascade="all, delete-orphan", lazy=True)
+    words = db.relationship('WordCloudWord', cascade="all, delete-orphan", lazy=True)
 
 class WordCloudEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -176,13 +197,24 @@ class WordCloudEntry(db.Model):
     voter_name = db.Column(db.String(100), default='Anonym')
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
+    __table_args__ = (db.Index('ix_word_cloud_entry_cloud_word', 'word_cloud_id', 'word'),)
+
+class WordCloudWord(db.Model):
+    # Maintained word -> count aggregate of WordCloudEntry, see word_clouds.py
+    id = db.Column(db.Integer, primary_key=True)
+    word_cloud_id = db.Column(db.Integer, db.ForeignKey('word_cloud.id'), nullable=False)
+    word = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, default=0)
+
+    __table_args__ = (db.UniqueConstraint('word_cloud_id', 'word', name='uq_word_cloud_word'),)
+
 class SharedFile(db.Model):
     id = db.Column(db.String(36), primary_key=True) # UUID
     filename = db.Column(db.String(255), nullable=False)
     filepath = db.Column(db.String(500), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
-    expires_at = db.Column(db.DateTime, nullable=True) # Absolute expiration
+    expires_at = db.Column(db.DateTime, nullable=True, index=True) # Absolute expiration, see share_expiry.py
     
     # Modes: 'time', 'download' (burn), 'open' (start timer on first access)
     expiration_mode = db.Column(db.String(20), default='time') 
@@ -192,8 +224,48 @@ class SharedFile(db.Model):
     # For 'open' mode
     first_accessed_at = db.Column(db.DateTime, nullable=True)
     access_window_hours = db.Column(db.Integer, default=4)
+
+    # 'pending' until file_scan.py has checked the file, then 'clean', 'blocked' or 'error'
+    # ('failed' once the share-scan job ran out of attempts)
+    scan_status = db.Column(db.String(20), default='pending')
+    scan_message = db.Column(db.String(255))
+    scan_attempts = db.Column(db.Integer, default=0)
+
+    # Content hash of the blob in filepath; NULL for files stored before blob_store.py
+    blob_sha256 = db.Column(db.String(64), index=True)
     
     user = db.relationship('User', backref=db.backref('shared_files', lazy=True))
+    download_sessions = db.relationship('DownloadSession', backref='shared_file', lazy=True,
+                                        cascade='all, delete-orphan')
+
+class Blob(db.Model):
+    # Shared file content stored once, referenced by SharedFile.blob_sha256 (blob_store.py)
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class DownloadSession(db.Model):
+    # One counted download per client; later Range requests resume it (public_server.py)
+    id = db.Column(db.Integer, primary_key=True)
+    shared_file_id = db.Column(db.String(36), db.ForeignKey('shared_file.id'), nullable=False, index=True)
+    client_key = db.Column(db.String(64), nullable=False) # Hash of client IP + User-Agent
+    resumed_bytes = db.Column(db.BigInteger, default=0) # Uncounted bytes, capped at the file size
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    last_seen_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class UploadSession(db.Model):
+    # Resumable chunked upload in progress, see uploads.py
+    id = db.Column(db.String(32), primary_key=True) # UUID hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    filepath = db.Column(db.String(500), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    bytes_received = db.Column(db.BigInteger, default=0) # Verified bytes written so far = next offset
+    expiration_mode = db.Column(db.String(20), default='time')
+    access_window_hours = db.Column(db.Integer, default=4)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
 class HandwritingChar(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -207,6 +279,15 @@ class HandwritingChar(db.Model):
 
     __table_args__ = (db.UniqueConstraint('user_id', 'character', name='uq_user_character'),)
 
+class JobRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_name = db.Column(db.String(100), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration_ms = db.Column(db.Integer, default=0)
+    status = db.Column(db.String(20), nullable=False) # 'ok' or 'error'
+    message = db.Column(db.String(255))
+    host = db.Column(db.String(100)) # hostname:pid of the leader that ran the job
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
@@ -218,101 +299,95 @@ def create_app():
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
 
+    # Only the process holding this lock runs the periodic jobs
+    os.makedirs(app.instance_path, exist_ok=True)
+    app.config['SCHEDULER_LOCK_FILE'] = os.path.join(app.instance_path, 'scheduler.lock')
+
     if app.config['SECRET_KEY'] == 'dev-secret-key-change-this':
         import logging
         logging.warning("SECURITY WARNING: Using default SECRET_KEY. Please change this in your environment variables for better security.")
 
-    db.init_app(app)
-    login_manager.init_app(app)
-    login_manager.login_view = 'login'
-    login_manager.session_protection = "strong"
-
-    with app.app_context():
-        db.create_all()
+    app.config['ADMIN_EMAILS'] = frozenset(e.strip() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip())
+    identity_cache = IdentityCache(system_config, ttl=int(os.environ.get('AUTH_CACHE_TTL', 300)))
+    app.extensions['identity_cache'] = identity_cache
 
-        # Migration: Add email column if it doesn't exist (renaming/migrating from username)
-        try:
-            # Check if email exists
-            db.session.execute(db.text('SELECT email FROM user LIMIT 1'))
-        except:
-            db.session.rollback()
-            try:
-                # Add email column
-                db.session.execute(db.text('ALTER TABLE user ADD COLUMN email VARCHAR(150)'))
-                # If we have old usernames, we could try to use them as emails, 
-                # but most likely they are just names. We'll leave them null or copy them.
-                db.session.execute(db.text('UPDATE user SET email = username'))
-                db.session.commit()
-            except:
-                db.session.rollback()
-                # If username also doesn't exist (very old DB), just add it
-                try:
-                    db.session.execute(db.text('ALTER TABLE user ADD COLUMN email VARCHAR(150)'))
-                    db.session.commit()
-                except:
-                    db.session.rollback()
+    click_counter = ClickCounter(app, db, flush_seconds=int(os.environ.get('CLICK_FLUSH_SECONDS', 5)))
+    app.extensions['click_counter'] = click_counter
 
-        # Migration: Add username column if it doesn't exist
-        try:
-            db.session.execute(db.text('SELECT username FROM user LIMIT 1'))
-        except:
-            db.session.rollback()
-            try:
-                db.session.execute(db.text('ALTER TABLE user ADD COLUMN username VARCHAR(150)'))
-                db.session.execute(db.text('UPDATE user SET username = email'))
-                db.session.commit()
-            except:
-                db.session.rollback()
+    poll_results_cache = polls.ResultsCache()
+    word_cloud_layouts = LayoutCache()
+    live_hub = LiveHub(app, poll_interval=float(os.environ.get('LIVE_POLL_INTERVAL', 1)),
+                       max_subscribers=int(os.environ.get('LIVE_MAX_SUBSCRIBERS', 500)))
+    app.extensions['live_hub'] = live_hub
 
-        # Migration: Add password_hash column if it doesn't exist
-        try:
-            db.session.execute(db.text('SELECT password_hash FROM user LIMIT 1'))
-        except:
-            db.session.rollback()
-            try:
-                db.session.execute(db.text('ALTER TABLE user ADD COLUMN password_hash VARCHAR(150)'))
-                db.session.execute(db.text("UPDATE user SET password_hash = 'cloudflare_auth'"))
-                db.session.commit()
-            except:
-                db.session.rollback()
+    ingest_queue = IngestQueue(app, db, flush_seconds=float(os.environ.get('INGEST_FLUSH_SECONDS', 0.25)),
+                               notify=live_hub.notify)
+    app.extensions['ingest_queue'] = ingest_queue
 
-        # Migration: Add is_admin column if it doesn't exist
-        try:
-            db.session.execute(db.text('SELECT is_admin FROM user LIMIT 1'))
-        except:
-            db.session.rollback()
-            try:
-                db.session.execute(db.text('ALTER TABLE user ADD COLUMN is_admin BOOLEAN DEFAULT 0'))
-                db.session.commit()
-            except:
-                db.session.rollback()
+    scan_queue = ScanQueue(app, db, workers=int(os.environ.get('SHARE_SCAN_WORKERS', 2)))
+    app.extensions['scan_queue'] = scan_queue
+    convert_jobs = ConvertJobs(os.path.join(tempfile.gettempdir(), 'l8te_jobs'),
+                               workers=int(os.environ.get('CONVERT_WORKERS', 0)) or None,
+                               ttl=timedelta(minutes=int(os.environ.get('CONVERT_RESULT_TTL_MINUTES', 60))),
+                               timeout=int(os.environ.get('CONVERT_JOB_TIMEOUT', 3600)),
+                               render_workers=CONVERT_RENDER_WORKERS)
+    app.extensions['convert_jobs'] = convert_jobs
 
-        # Ensure retention config exists
-        retention_config = SystemConfig.query.filter_by(key='file_retention_minutes').first()
-        if not retention_config:
-            db.session.add(SystemConfig(key='file_retention_minutes', value='1440'))
-            db.session.commit()
+    db.init_app(app)
+    login_manager.init_app(app)
+    login_manager.login_view = 'login'
+    login_manager.session_protection = "strong"
 
-        # Ensure default domain exists
-        domain_config = SystemConfig.query.filter_by(key='shortener_domain').first()
-        if not domain_config:
-            db.session.add(SystemConfig(key='shortener_domain', value='tools.l8tenever.de'))
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            use_wal = os.environ.get('SQLITE_WAL', 'true').lower() == 'true'
+
+            @event.listens_for(db.engine, 'connect')
+            def sqlite_pragmas(dbapi_connection, connection_record):
+                # Readers no longer block the writer, and a busy writer lock is waited for instead of failing
+                cursor = dbapi_connection.cursor()
+                cursor.execute('PRAGMA busy_timeout = 10000')
+                if use_wal:
+                    cursor.execute('PRAGMA journal_mode = WAL')
+                cursor.close()
+
+        # Fast path: a single SELECT when the schema is already current
+        schema_current = True
+        if os.environ.get('AUTO_MIGRATE', 'true').lower() == 'true':
+            migrations.upgrade(db, lock_path=os.path.join(app.instance_path, 'migrate.lock'), verbose=True)
+        elif not migrations.is_current(db):
+            schema_current = False
+            import logging
+            logging.warning("Database schema is outdated. Run 'python manage.py migrate'.")
+
+        # Admin emails from environment (parsed once per process)
+        admin_emails = app.config['ADMIN_EMAILS']
+        if admin_emails and schema_current:
+            known = {u.email for u in User.query.filter(User.email.in_(admin_emails)).all()}
+            for email in admin_emails:
+                if email not in known:
+                    # Provide username and dummy password hash to satisfy constraints
+                    db.session.add(User(email=email, username=email, password_hash='cloudflare_auth', is_admin=True))
             db.session.commit()
 
-        # Admin emails from environment
-        admin_emails = os.environ.get('ADMIN_EMAILS', '').split(',')
-        for email in admin_emails:
-            email = email.strip()
-            if email and not User.query.filter_by(email=email).first():
-                # Provide username and dummy password hash to satisfy constraints
-                admin = User(email=email, username=email, password_hash='cloudflare_auth', is_admin=True)
-                db.session.add(admin)
-                db.session.commit()
-
 
     @login_manager.user_loader
     def load_user(user_id):
-        return db.session.get(User, int(user_id))
+        identity = identity_cache.get_by_id(int(user_id))
+        if identity:
+            return identity
+        user = db.session.get(User, int(user_id))
+        return identity_cache.put(user) if user else None
+
+    @app.before_request
+    def shortlink_fast_path():
+        # Known shortlinks are answered from memory before auth and session handling
+        if request.endpoint != 'catch_all_redirect':
+            return
+        link = slug_index.lookup(request.view_args['slug'])
+        if link:
+            click_counter.record(link[0])
+            return redirect(link[1])
 
     @app.before_request
     def handle_cloudflare_auth():
@@ -327,24 +402,27 @@ def create_app():
             cf_email = "dev@local.host"
 
         if cf_email:
-            user = User.query.filter_by(email=cf_email).first()
-            if not user:
-                # Automatisches Erstellen neuer User falls sie über Cloudflare reinkommen
-                # Falls ADMIN_EMAILS gesetzt ist, prüfen wir ob dieser User Admin sein sollte
-                admin_emails = [e.strip() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()]
-                is_admin = cf_email in admin_emails
-                
-                # Wenn kein Admin definiert ist, wird der ERSTE User Admin
-                if not User.query.filter_by(is_admin=True).first():
-                    is_admin = True
+            # Hot path: known users are served from the identity cache without a DB query
+            identity = identity_cache.get_by_email(cf_email)
+            if not identity:
+                user = User.query.filter_by(email=cf_email).first()
+                if not user:
+                    # Automatisches Erstellen neuer User falls sie über Cloudflare reinkommen
+                    # Falls ADMIN_EMAILS gesetzt ist, prüfen wir ob dieser User Admin sein sollte
+                    is_admin = cf_email in app.config['ADMIN_EMAILS']
+                    
+                    # Wenn kein Admin definiert ist, wird der ERSTE User Admin
+                    if not User.query.filter_by(is_admin=True).first():
+                        is_admin = True
 
-                # Provide username and dummy password hash to satisfy constraints
-                user = User(email=cf_email, username=cf_email, password_hash='cloudflare_auth', is_admin=is_admin)
-                db.session.add(user)
-                db.session.commit()
+                    # Provide username and dummy password hash to satisfy constraints
+                    user = User(email=cf_email, username=cf_email, password_hash='cloudflare_auth', is_admin=is_admin)
+                    db.session.add(user)
+                    db.session.commit()
+                identity = identity_cache.put(user)
             
-            if not current_user.is_authenticated or current_user.email != cf_email:
-                login_user(user, remember=True)
+            if not current_user.is_authenticated or current_user.id != identity.id:
+                login_user(identity, remember=True)
         else:
             # If no header is present, we are not authenticated via Cloudflare
             # Since the user wants to remove the login page, we show a nice error
@@ -428,8 +506,18 @@ def create_app():
     @login_required
     def shortlinks():
         user_links = Shortlink.query.filter_by(user_id=current_user.id).order_by(Shortlink.created_at.desc()).all()
-        domain = SystemConfig.query.filter_by(key='shortener_domain').first().value
-        return render_template('tools/shortlinks.html', links=user_links, domain=domain)
+        domain = system_config.get('shortener_domain')
+
+        # Clicks of the last 7 days per link (today included)
+        week_start = datetime.now().date() - timedelta(days=6)
+        week_clicks = dict(db.session.query(
+            ShortlinkDailyClicks.shortlink_id, db.func.sum(ShortlinkDailyClicks.count)
+        ).join(Shortlink).filter(
+            Shortlink.user_id == current_user.id, ShortlinkDailyClicks.day >= week_start
+        ).group_by(ShortlinkDailyClicks.shortlink_id).all())
+
+        return render_template('tools/shortlinks.html', links=user_links, domain=domain,
+                               week_clicks=week_clicks, pending_clicks=click_counter.pending)
 
     @app.route('/tools/video-downloader')
     @login_required
@@ -445,6 +533,7 @@ def create_app():
             return jsonify({'error': 'URL erforderlich'}), 400
         
         try:
+            yt_dlp = deps.load('yt_dlp')
             ydl_opts = {
                 'quiet': True,
                 'no_warnings': True,
@@ -477,7 +566,8 @@ def create_app():
             if not os.path.exists(download_dir):
                 os.makedirs(download_dir)
 
-            ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
+            yt_dlp = deps.load('yt_dlp')
+            ffmpeg_path = deps.load('imageio_ffmpeg').get_ffmpeg_exe()
             
             ydl_opts = {
                 'outtmpl': os.path.join(download_dir, '%(title)s.%(ext)s'),
@@ -529,15 +619,20 @@ def create_app():
     @app.route('/settings')
     @login_required
     def settings():
-        domain_conf = SystemConfig.query.filter_by(key='shortener_domain').first()
-        domain = domain_conf.value if domain_conf else "tools.l8tenever.de"
-        
-        retention_conf = SystemConfig.query.filter_by(key='file_retention_minutes').first()
-        retention_minutes = int(retention_conf.value) if retention_conf else 1440
+        domain = system_config.get('shortener_domain')
+        retention_minutes = system_config.get('file_retention_minutes')
 
         all_users = []
+        job_runs = []
+        scheduler_leader = None
+        ingest_stats = None
+        storage_stats = None
         if current_user.is_admin:
             all_users = User.query.all()
+            job_runs = JobRun.query.order_by(JobRun.id.desc()).limit(20).all()
+            scheduler_leader = read_leader(app.config['SCHEDULER_LOCK_FILE'])
+            ingest_stats = ingest_queue.stats()
+            storage_stats = blob_store.stats(db.session)
         
         version = "v.0.0.0"
         try:
@@ -546,7 +641,9 @@ def create_app():
         except:
             pass
             
-        return render_template('settings.html', domain=domain, retention_minutes=retention_minutes, users=all_users, version=version)
+        return render_template('settings.html', domain=domain, retention_minutes=retention_minutes, users=all_users, version=version,
+                               job_runs=job_runs, scheduler_leader=scheduler_leader, ingest_stats=ingest_stats,
+                               storage_stats=storage_stats)
 
     @app.route('/api/settings/retention', methods=['POST'])
     @login_required
@@ -560,14 +657,7 @@ def create_app():
             if minutes < 0: 
                 return jsonify({'error': 'Ungültiger Wert'}), 400
             
-            config = SystemConfig.query.filter_by(key='file_retention_minutes').first()
-            if not config:
-                config = SystemConfig(key='file_retention_minutes', value=str(minutes))
-                db.session.add(config)
-            else:
-                config.value = str(minutes)
-                
-            db.session.commit()
+            system_config.set('file_retention_minutes', minutes)
             return jsonify({'message': 'Aufbewahrungszeitraum aktualisiert'})
         except ValueError:
             return jsonify({'error': 'Muss eine Zahl sein'}), 400
@@ -584,9 +674,7 @@ def create_app():
         if not new_domain:
             return jsonify({'error': 'Domain darf nicht leer sein'}), 400
             
-        config = SystemConfig.query.filter_by(key='shortener_domain').first()
-        config.value = new_domain
-        db.session.commit()
+        system_config.set('shortener_domain', new_domain)
         return jsonify({'message': 'Domain aktualisiert'})
 
     @app.route('/tools/playground')
@@ -637,6 +725,7 @@ def create_app():
             file.save(temp_path)
 
             # Analyze EXIF
+            deps.get('heif')
             img = Image.open(temp_path)
             exif_data = {}
             raw_exif = img.getexif()
@@ -676,6 +765,7 @@ def create_app():
             if not os.path.exists(temp_path):
                 return jsonify({'error': 'Datei nicht gefunden (Session abgelaufen)'}), 404
 
+            deps.get('heif')
             img = Image.open(temp_path)
             
             if action == 'clean':
@@ -902,7 +992,7 @@ def create_app():
         if not domain:
             return jsonify({'error': 'Domain erforderlich'}), 400
         try:
-            w = whois.whois(domain)
+            w = deps.load('whois').whois(domain)
             # Convert datetime objects to string
             result = {}
             for key, value in w.items():
@@ -963,7 +1053,7 @@ def create_app():
             if start_date > end_date:
                 start_date, end_date = end_date, start_date
 
-            de_holidays = holidays.DE() # Germany holidays
+            de_holidays = deps.load('holidays').DE() # Germany holidays
             
             total_days = (end_date - start_date).days + 1
             workdays = 0
@@ -1025,62 +1115,62 @@ def create_app():
     @app.route('/api/files/upload', methods=['POST'])
     @login_required
     def api_file_upload():
-        if 'files' not in request.files:
+        # Parts are streamed straight to the final file or ZIP entry, see share_archive.py
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
             return jsonify({'error': 'No files'}), 400
-        
-        files = request.files.getlist('files')
-        mode = request.form.get('mode', 'time')
-        hours = int(request.form.get('hours', 4))
-        
+
+        try:
+            fields, filename, final_path, sha256, archive = share_archive.receive_upload(
+                request.stream, boundary, app.config['UPLOAD_FOLDER'])
+        except BadRequest as e:
+            return jsonify({'error': e.description}), 400
+        if not filename:
+            return jsonify({'error': 'No files'}), 400
+
+        try:
+            mode, hours = share_options(fields)
+        except ValueError as e:
+            os.remove(final_path)
+            return jsonify({'error': str(e)}), 400
+
+        if archive:
+            print(f"[Share] {archive['files']} Dateien gepackt: {archive['raw_bytes']} -> {archive['zip_bytes']} Bytes "
+                  f"(Ratio {archive['ratio']}, {archive['build_ms']} ms)")
+
+        token = create_share(filename, final_path, mode, hours, sha256)
+        return jsonify({'token': token, 'scan_status': 'pending', 'archive': archive})
+
+    def share_options(values):
+        """Expiration mode and hours of an upload request; raises ValueError."""
+        mode = values.get('mode') or 'time'
+        if mode not in SHARE_MODES:
+            raise ValueError('Unbekannter Ablaufmodus')
+        try:
+            hours = int(values.get('hours') or 4)
+        except (TypeError, ValueError):
+            raise ValueError('Ungültige Ablaufzeit')
+        if not 1 <= hours <= MAX_SHARE_HOURS:
+            raise ValueError(f'Die Ablaufzeit muss zwischen 1 und {MAX_SHARE_HOURS} Stunden liegen')
+        return mode, hours
+
+    def create_share(filename, filepath, mode, hours, sha256=None):
+        # Create DB Entry
+        token = uuid.uuid4().hex
+
+        # Identical content is stored only once, see blob_store.py
+        sha256, filepath = blob_store.store(db.session, app.config['UPLOAD_FOLDER'], filepath, sha256)
+
         # Determine strict expiration if strictly time-based
         expires_at = None
         if mode == 'time':
             expires_at = datetime.now() + timedelta(hours=hours)
-        
-        # Handle first file (Multi-file zip logic could be added here, currently handling single/latest for simplicity or zip all)
-        # Requirement says "files", plural. Let's zip them if > 1, or just save one.
-        # Implementation: Only saving the first for MVP to stay robust, or Zip.
-        # Let's Zip if multiple.
-        
-        file_to_save = files[0]
-        filename = file_to_save.filename
-        
-        # Virus Scan Simulation
-        # Simulate check
-        time.sleep(1) # Fake processing time
-        # Check extensions
-        ext = os.path.splitext(filename)[1].lower()
-        # if ext in ['.exe', '.bat', '.vbs', '.cmd']:
-        #    return jsonify({'error': 'Security Alert: Executable files blocked by policy.'}), 400
-
-        final_path = ''
-        
-        if len(files) > 1:
-            # Create a ZIP
-            filename = f"archive_{uuid.uuid4().hex[:8]}.zip"
-            final_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            with zipfile.ZipFile(final_path, 'w') as zf:
-                for f in files:
-                    # Save to temp then add? Or writestr if small. 
-                    # write str is memory heavy. Save each to temp.
-                    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                        f.save(tmp.name)
-                        tmp.close()
-                        zf.write(tmp.name, f.filename)
-                        os.unlink(tmp.name)
-        else:
-            # Single file
-            safe_name = f"{uuid.uuid4().hex}_{filename}"
-            final_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_name)
-            file_to_save.save(final_path)
 
-        # Create DB Entry
-        token = uuid.uuid4().hex
-        
         share = SharedFile(
             id=token,
             filename=filename,
-            filepath=final_path,
+            filepath=filepath,
+            blob_sha256=sha256,
             user_id=current_user.id,
             expiration_mode=mode,
             expires_at=expires_at,
@@ -1092,21 +1182,132 @@ def create_app():
         
         db.session.add(share)
         db.session.commit()
-        
-        return jsonify({'token': token})
+
+        # Downloads stay blocked until the scan has finished, see file_scan.py
+        scan_queue.submit(token)
+        return token
+
+    # Resumable chunked uploads, see uploads.py
+    def get_upload_session(upload_id):
+        upload = UploadSession.query.get(upload_id)
+        if not upload or upload.user_id != current_user.id:
+            return None
+        return upload
+
+    @app.route('/api/files/uploads', methods=['POST'])
+    @login_required
+    def api_upload_create():
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Ungültige Anfrage'}), 400
+        filename = str(data.get('filename') or '').strip()
+        try:
+            mode, hours = share_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        try:
+            size = int(data.get('size', 0))
+        except (TypeError, ValueError):
+            size = 0
+
+        if not filename:
+            return jsonify({'error': 'Dateiname fehlt'}), 400
+        if size <= 0 or size > app.config['MAX_CONTENT_LENGTH']:
+            return jsonify({'error': 'Ungültige Dateigröße (max. 1 GB)'}), 400
+
+        upload_id = uuid.uuid4().hex
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{upload_id}_{secure_filename(filename) or 'datei'}")
+        uploads.create_file(filepath)
+
+        upload = UploadSession(id=upload_id, user_id=current_user.id, filename=filename, filepath=filepath,
+                               size=size, bytes_received=0, expiration_mode=mode, access_window_hours=hours)
+        db.session.add(upload)
+        db.session.commit()
+        return jsonify({'id': upload_id, 'offset': 0, 'size': size, 'chunk_size': uploads.CHUNK_MAX_BYTES})
+
+    @app.route('/api/files/uploads/<upload_id>', methods=['GET'])
+    @login_required
+    def api_upload_status(upload_id):
+        upload = get_upload_session(upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload nicht gefunden'}), 404
+        return jsonify({'id': upload.id, 'offset': upload.bytes_received, 'size': upload.size})
+
+    @app.route('/api/files/uploads/<upload_id>', methods=['PUT'])
+    @login_required
+    def api_upload_chunk(upload_id):
+        upload = get_upload_session(upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload nicht gefunden'}), 404
+
+        offset = request.args.get('offset', type=int)
+        length = request.content_length
+        if offset is None:
+            return jsonify({'error': 'offset fehlt'}), 400
+        if length and offset + length > upload.size:
+            return jsonify({'error': 'Block überschreitet die Dateigröße', 'offset': upload.bytes_received}), 400
+
+        try:
+            with uploads.open_locked(upload.filepath) as f:
+                # Re-read under the file lock: another request may just have finished a chunk
+                db.session.refresh(upload)
+                if offset != upload.bytes_received:
+                    return jsonify({'error': 'Falscher Offset', 'offset': upload.bytes_received}), 409
+                checksum = request.headers.get('X-Chunk-SHA256')
+                upload.bytes_received = uploads.write_chunk(f, offset, request.stream, length, checksum)
+                db.session.commit()
+        except uploads.ChunkError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e), 'offset': upload.bytes_received}), e.status
+        except FileNotFoundError:
+            return jsonify({'error': 'Upload nicht gefunden'}), 404
+
+        return jsonify({'offset': upload.bytes_received})
+
+    @app.route('/api/files/uploads/<upload_id>/finalize', methods=['POST'])
+    @login_required
+    def api_upload_finalize(upload_id):
+        upload = get_upload_session(upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload nicht gefunden'}), 404
+        if upload.bytes_received != upload.size:
+            return jsonify({'error': 'Upload unvollständig', 'offset': upload.bytes_received}), 409
+
+        # The chunks were written to the final path already, only the row changes
+        filename, filepath = upload.filename, upload.filepath
+        mode, hours = upload.expiration_mode, upload.access_window_hours
+        if UploadSession.query.filter_by(id=upload_id).delete() == 0:
+            # A concurrent finalize won
+            return jsonify({'error': 'Upload nicht gefunden'}), 404
+        token = create_share(filename, filepath, mode, hours)
+        return jsonify({'token': token, 'scan_status': 'pending'})
+
+    @app.route('/api/files/uploads/<upload_id>', methods=['DELETE'])
+    @login_required
+    def api_upload_abort(upload_id):
+        upload = get_upload_session(upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload nicht gefunden'}), 404
+        uploads.discard(upload.filepath)
+        db.session.delete(upload)
+        db.session.commit()
+        return jsonify({'message': 'Upload abgebrochen'})
 
     @app.route('/api/files/list')
     @login_required
     def api_files_list():
-        # Clean up old ones first (lazy cleanup)
-        cleanup_expired_files()
-        
-        files = SharedFile.query.filter_by(user_id=current_user.id).order_by(SharedFile.created_at.desc()).all()
+        # Expired shares are deleted by the share-expiry job, until then they are just hidden
+        files = SharedFile.query.filter(
+            SharedFile.user_id == current_user.id,
+            db.or_(SharedFile.expires_at.is_(None), SharedFile.expires_at >= datetime.now())
+        ).order_by(SharedFile.created_at.desc()).all()
         return jsonify([{
             'token': f.id,
             'filename': f.filename,
             'expires_at': f.expires_at.strftime('%Y-%m-%d %H:%M') if f.expires_at else 'On Action',
-            'downloads': f.download_count
+            'downloads': f.download_count,
+            'scan_status': f.scan_status,
+            'scan_message': f.scan_message
         } for f in files])
 
     @app.route('/api/files/delete/<token>', methods=['DELETE'])
@@ -1114,34 +1315,18 @@ def create_app():
     def api_files_delete(token):
         f = SharedFile.query.get(token)
         if f and f.user_id == current_user.id:
-            try:
-                if os.path.exists(f.filepath):
-                    os.remove(f.filepath)
-            except: pass
-            db.session.delete(f)
+            # Release only if this DELETE removed the row (public_server.py and
+            # the share-expiry sweep delete shares concurrently)
+            sha256, filepath = f.blob_sha256, f.filepath
+            db.session.expunge(f)
+            db.session.execute(db.text('DELETE FROM download_session WHERE shared_file_id = :id'), {'id': token})
+            if db.session.execute(db.text('DELETE FROM shared_file WHERE id = :id'), {'id': token}).rowcount == 1:
+                blob_store.release(db.session, sha256, filepath)
             db.session.commit()
         return jsonify({'success': True})
 
     # /s/<token> routes moved to public_server.py (separate port, no auth required)
 
-    def delete_shared_file(file_obj):
-        try:
-            if os.path.exists(file_obj.filepath):
-                os.remove(file_obj.filepath)
-        except: pass
-        db.session.delete(file_obj)
-        db.session.commit()
-
-    def cleanup_expired_files():
-        # Find time expired
-        now = datetime.now()
-        expired = SharedFile.query.filter(SharedFile.expires_at < now).all()
-        for f in expired:
-            delete_shared_file(f)
-            
-        # Find download limit expired (if any slipped through)
-        # Implementation Detail: Done on access mostly.
-
     # Notes API
     @app.route('/api/notes', methods=['GET'])
     @login_required
@@ -1282,6 +1467,7 @@ def create_app():
         
         db.session.delete(user)
         db.session.commit()
+        identity_cache.invalidate(user_id=user_id)
         return jsonify({'message': 'Benutzer gelöscht'})
 
     @app.route('/api/settings/users/<int:user_id>/reset-password', methods=['POST'])
@@ -1323,6 +1509,7 @@ def create_app():
         new_link = Shortlink(slug=slug, target_url=target, user_id=current_user.id)
         db.session.add(new_link)
         db.session.commit()
+        slug_index.changed()
         return jsonify({'message': 'Shortlink erstellt'})
 
     # Polls API
@@ -1377,6 +1564,7 @@ def create_app():
         
         db.session.delete(poll)
         db.session.commit()
+        poll_results_cache.invalidate(poll_id)
         return jsonify({'message': 'Umfrage gelöscht'})
 
     @app.route('/poll/<slug>')
@@ -1401,31 +1589,43 @@ def create_app():
         if not option:
             return jsonify({'error': 'Ungültige Option'}), 400
 
-        vote = PollVote(poll_option_id=option.id, voter_name=voter_name)
-        db.session.add(vote)
-        db.session.commit()
+        # Persisted with the next batch, see ingest.py
+        ingest_queue.add_vote(poll.id, slug, option.id, voter_name)
 
         return jsonify({'message': 'Stimme abgegeben'})
 
     @app.route('/api/poll/<slug>/results')
     def api_poll_results(slug):
         poll = Poll.query.filter_by(slug=slug).first_or_404()
-        
-        results = []
-        for opt in poll.options:
-            results.append({
-                'id': opt.id,
-                'text': opt.text,
-                'votes': len(opt.votes)
-            })
-        
-        return jsonify({
-            'title': poll.title,
-            'question': poll.question,
-            'results': results,
-            'total_votes': sum(r['votes'] for r in results)
+        return jsonify(poll_results_cache.get(db.session, poll))
+
+    def event_stream_response(stream):
+        if stream is None:
+            # Hub is full: the client falls back to polling the JSON endpoint
+            return jsonify({'error': 'Zu viele Live-Verbindungen'}), 503
+        return Response(stream, mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
         })
 
+    def stream_gone():
+        # 204 is the one answer EventSource does not reconnect after
+        return '', 204
+
+    @app.route('/api/poll/<slug>/stream')
+    def api_poll_stream(slug):
+        if not Poll.query.filter_by(slug=slug).first():
+            return stream_gone()
+
+        def version():
+            return db.session.execute(db.text('SELECT COALESCE(results_version, 0) FROM poll WHERE slug = :slug'),
+                                      {'slug': slug}).scalar()
+
+        def snapshot():
+            return poll_results_cache.get(db.session, Poll.query.filter_by(slug=slug).first())
+
+        return event_stream_response(live_hub.subscribe(('poll', slug), version, snapshot))
+
     @app.route('/api/poll/<slug>/suggest', methods=['POST'])
     def api_poll_suggest(slug):
         poll = Poll.query.filter_by(slug=slug).first_or_404()
@@ -1450,14 +1650,16 @@ def create_app():
             return jsonify({'error': 'Dieser Vorschlag existiert bereits'}), 400
 
         # Create new option
-        new_opt = PollOption(poll_id=poll.id, text=suggestion_text)
+        new_opt = PollOption(poll_id=poll.id, text=suggestion_text, vote_count=1)
         db.session.add(new_opt)
         db.session.flush()
 
         # Add initial vote 
         vote = PollVote(poll_option_id=new_opt.id, voter_name=voter_name or 'Anonym')
         db.session.add(vote)
+        polls.bump_version(db.session, poll.id)
         db.session.commit()
+        live_hub.notify(('poll', slug))
 
         return jsonify({'message': 'Vorschlag hinzugefügt', 'option_id': new_opt.id})
 
@@ -1493,6 +1695,7 @@ def create_app():
         
         db.session.delete(cloud)
         db.session.commit()
+        word_cloud_layouts.invalidate(cloud_id)
         return jsonify({'message': 'Word Cloud gelöscht'})
 
     @app.route('/wordcloud/<slug>')
@@ -1516,27 +1719,61 @@ def create_app():
         if len(word) > 30:
             return jsonify({'error': 'Wort ist zu lang'}), 400
 
-        entry = WordCloudEntry(word_cloud_id=cloud.id, word=word, voter_name=name)
-        db.session.add(entry)
-        db.session.commit()
+        ingest_queue.add_word(cloud.id, slug, word, name)
 
         return jsonify({'message': 'Wort hinzugefügt'})
 
     @app.route('/api/wordcloud/<slug>/data')
     def api_word_cloud_data(slug):
         cloud = WordCloud.query.filter_by(slug=slug).first_or_404()
-        
-        from sqlalchemy import func
-        entries = db.session.query(
-            WordCloudEntry.word, 
-            func.count(WordCloudEntry.id).label('count')
-        ).filter(WordCloudEntry.word_cloud_id == cloud.id).group_by(WordCloudEntry.word).all()
-        
-        return jsonify({
-            'title': cloud.title,
-            'description': cloud.description,
-            'words': [{'text': e.word, 'size': e.count} for e in entries]
-        })
+        etag = word_clouds.etag(cloud)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = jsonify(word_clouds.compute_words(db.session, cloud))
+        response.set_etag(etag)
+        # Browsers revalidate every refresh and get an empty 304 while nothing changed
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def word_cloud_render(slug, render, mimetype):
+        cloud = WordCloud.query.filter_by(slug=slug).first_or_404()
+        etag = word_clouds.etag(cloud)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            words = lambda: word_clouds.compute_words(db.session, cloud)['words']
+            response = Response(render(cloud.id, cloud.version or 0, words), mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    @app.route('/api/wordcloud/<slug>/layout')
+    def api_word_cloud_layout(slug):
+        # Positions in a WIDTH x HEIGHT canvas, see word_cloud_layout.py
+        return word_cloud_render(slug, lambda *a: json.dumps(word_cloud_layouts.layout(*a)), 'application/json')
+
+    @app.route('/api/wordcloud/<slug>/cloud.svg')
+    def api_word_cloud_svg(slug):
+        return word_cloud_render(slug, word_cloud_layouts.svg, 'image/svg+xml')
+
+    @app.route('/api/wordcloud/<slug>/cloud.png')
+    def api_word_cloud_png(slug):
+        return word_cloud_render(slug, word_cloud_layouts.png, 'image/png')
+
+    @app.route('/api/wordcloud/<slug>/stream')
+    def api_word_cloud_stream(slug):
+        if not WordCloud.query.filter_by(slug=slug).first():
+            return stream_gone()
+
+        def version():
+            return db.session.execute(db.text('SELECT COALESCE(version, 0) FROM word_cloud WHERE slug = :slug'),
+                                      {'slug': slug}).scalar()
+
+        def snapshot():
+            return word_clouds.compute_words(db.session, WordCloud.query.filter_by(slug=slug).first())
+
+        return event_stream_response(live_hub.subscribe(('wordcloud', slug), version, snapshot))
 
     @app.route('/api/shortlinks/<int:link_id>', methods=['DELETE'])
     @login_required
@@ -1547,11 +1784,30 @@ def create_app():
         
         db.session.delete(link)
         db.session.commit()
+        slug_index.changed()
         return jsonify({'message': 'Shortlink gelöscht'})
 
+    def save_convert_inputs(files, work_dir):
+        inputs = []
+        for i, file in enumerate(files):
+            path = os.path.join(work_dir, f"in_{i}_{secure_filename(file.filename) or 'datei'}")
+            file.save(path)
+            inputs.append((path, file.filename))
+        return inputs
+
+    def convert_options(form):
+        """Settings of a conversion request for converter.convert; raises ValueError."""
+        return {
+            'dpi': pdf_raster.parse_dpi(form.get('dpi'), CONVERT_PDF_DPI),
+            'pages': pdf_raster.parse_pages(form.get('pages')),
+            'ffmpeg_threads': CONVERT_FFMPEG_THREADS,
+            'ffmpeg_preset': CONVERT_FFMPEG_PRESET,
+        }
+
     @app.route('/api/convert', methods=['POST'])
     @login_required
     def api_convert():
+        # Synchronous variant for small batches; long conversions go through /api/convert/jobs
         if 'files' not in request.files:
             return jsonify({'error': 'Keine Dateien hochgeladen'}), 400
         
@@ -1560,164 +1816,93 @@ def create_app():
         
         if not files:
             return jsonify({'error': 'Keine Dateien ausgewählt'}), 400
-
-        output = io.BytesIO()
-        
+        if target_format not in converter.OUTPUTS:
+            return jsonify({'error': 'Unbekanntes Zielformat'}), 400
+        try:
+            # A request worker renders and encodes on its own core; the
+            # CONVERT_RENDER_WORKERS pool belongs to the background jobs
+            options = dict(convert_options(request.form), render_workers=1)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        download_name, mimetype = converter.OUTPUTS[target_format]
+        work_dir = tempfile.mkdtemp(prefix='l8te_convert_')
         try:
-            # 1. Image & Document Unification to PDF
+            inputs = save_convert_inputs(files, work_dir)
             if target_format == 'pdf':
-                pdf_bytes = []
-                for file in files:
-                    filename = file.filename.lower()
-                    file_data = file.read()
-                    
-                    if filename.endswith(('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.tiff', '.heic')):
-                        img = Image.open(io.BytesIO(file_data))
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        img_byte_arr = io.BytesIO()
-                        img.save(img_byte_arr, format='JPEG')
-                        pdf_bytes.append(img2pdf.convert(img_byte_arr.getvalue()))
-                    elif filename.endswith('.svg'):
-                        svg_pdf = cairosvg.svg2pdf(bytestring=file_data)
-                        pdf_bytes.append(svg_pdf)
-                    elif filename.endswith(('.md', '.txt')):
-                        doc = fitz.open()
-                        page = doc.new_page()
-                        text = file_data.decode('utf-8', errors='ignore')
-                        page.insert_text((50, 50), text)
-                        pdf_bytes.append(doc.tobytes())
-                        doc.close()
-                    elif filename.endswith('.pdf'):
-                        pdf_bytes.append(file_data)
-                
-                doc = fitz.open()
-                for pb in pdf_bytes:
-                    temp_doc = fitz.open("pdf", pb)
-                    doc.insert_pdf(temp_doc)
-                    temp_doc.close()
-                
-                output.write(doc.tobytes())
-                doc.close()
-                output.seek(0)
-                return send_file(output, mimetype='application/pdf', as_attachment=True, download_name="converted.pdf")
-
-            # 2. Image formats (PNG, JPG, WEBP)
-            elif target_format in ['png', 'jpg', 'webp']:
-                with zipfile.ZipFile(output, 'w') as zf:
-                    for i, file in enumerate(files):
-                        filename = file.filename.lower()
-                        file_data = file.read()
-                        
-                        if filename.endswith('.pdf'):
-                            pdf_doc = fitz.open("pdf", file_data)
-                            for page_num in range(len(pdf_doc)):
-                                page = pdf_doc.load_page(page_num)
-                                pix = page.get_pixmap()
-                                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                                img_byte_arr = io.BytesIO()
-                                img.save(img_byte_arr, format=target_format.upper())
-                                zf.writestr(f"file_{i}_page_{page_num}.{target_format}", img_byte_arr.getvalue())
-                            pdf_doc.close()
-                        elif filename.endswith('.svg'):
-                            png_bytes = cairosvg.svg2png(bytestring=file_data)
-                            img = Image.open(io.BytesIO(png_bytes))
-                            img_byte_arr = io.BytesIO()
-                            img.save(img_byte_arr, format=target_format.upper())
-                            zf.writestr(f"file_{i}.{target_format}", img_byte_arr.getvalue())
-                        else:
-                            img = Image.open(io.BytesIO(file_data))
-                            if target_format in ['jpg', 'jpeg'] and img.mode != 'RGB':
-                                img = img.convert('RGB')
-                            img_byte_arr = io.BytesIO()
-                            img.save(img_byte_arr, format=target_format.upper())
-                            zf.writestr(f"file_{i}.{target_format}", img_byte_arr.getvalue())
-                
-                output.seek(0)
-                if len(files) == 1 and not files[0].filename.lower().endswith('.pdf'):
-                    # Just send the single file instead of ZIP if possible
-                    # But for simplicity, zip is fine for multi-task tool
-                    pass
-                return send_file(output, mimetype='application/zip', as_attachment=True, download_name="converted_images.zip")
-
-            # 3. Document formats (DOCX, TXT)
-            elif target_format in ['docx', 'txt']:
-                with zipfile.ZipFile(output, 'w') as zf:
-                    for i, file in enumerate(files):
-                        filename = file.filename.lower()
-                        file_data = file.read()
-                        
-                        if target_format == 'docx' and filename.endswith('.pdf'):
-                            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tf_in:
-                                tf_in.write(file_data)
-                                tf_in_path = tf_in.name
-                            tf_out_path = tf_in_path.replace('.pdf', '.docx')
-                            try:
-                                cv = PDF2Docx(tf_in_path)
-                                cv.convert(tf_out_path)
-                                cv.close()
-                                with open(tf_out_path, 'rb') as f:
-                                    zf.writestr(f"file_{i}.docx", f.read())
-                            finally:
-                                if os.path.exists(tf_in_path): os.remove(tf_in_path)
-                                if os.path.exists(tf_out_path): os.remove(tf_out_path)
-                        elif target_format == 'txt':
-                            if filename.endswith('.pdf'):
-                                pdf_doc = fitz.open("pdf", file_data)
-                                text = ""
-                                for page in pdf_doc:
-                                    text += page.get_text()
-                                zf.writestr(f"file_{i}.txt", text.encode('utf-8'))
-                                pdf_doc.close()
-                            else:
-                                zf.writestr(f"file_{i}.txt", file_data)
-                output.seek(0)
-                return send_file(output, mimetype='application/zip', as_attachment=True, download_name="converted_docs.zip")
-
-            # 4. Media formats (Audio, Video)
-            elif target_format in ['mp3', 'wav', 'ogg', 'mp4', 'mov']:
-                with zipfile.ZipFile(output, 'w') as zf:
-                    for i, file in enumerate(files):
-                        filename = file.filename.lower()
-                        file_data = file.read()
-                        ext = os.path.splitext(filename)[1]
-                        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tf_in:
-                            tf_in.write(file_data)
-                            tf_in_path = tf_in.name
-                        
-                        tf_out_path = tf_in_path + f".{target_format}"
-                        
-                        try:
-                            if target_format in ['mp3', 'wav', 'ogg']:
-                                try:
-                                    clip = mp.AudioFileClip(tf_in_path)
-                                except:
-                                    clip = mp.VideoFileClip(tf_in_path).audio
-                                clip.write_audiofile(tf_out_path)
-                                clip.close()
-                            else:
-                                clip = mp.VideoFileClip(tf_in_path)
-                                clip.write_videofile(tf_out_path, codec="libx264")
-                                clip.close()
-                            
-                            with open(tf_out_path, 'rb') as f:
-                                zf.writestr(f"file_{i}.{target_format}", f.read())
-                        finally:
-                            if os.path.exists(tf_in_path): os.remove(tf_in_path)
-                            if os.path.exists(tf_out_path): os.remove(tf_out_path)
-
-                output.seek(0)
-                return send_file(output, mimetype='application/zip', as_attachment=True, download_name="converted_media.zip")
-
+                path = converter.convert(inputs, target_format, work_dir, options=options)
+                response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name)
+                response.call_on_close(lambda: shutil.rmtree(work_dir, ignore_errors=True))
+                return response
+
+            # ZIP targets are streamed entry by entry (zip_stream.py). The first
+            # entry is converted here, so early errors still get an error response
+            chunks = zip_stream.stream(converter.entries(inputs, target_format, work_dir, options=options))
+            first = next(chunks)
+
+            def cleanup():
+                # Also runs if the client went away in the middle of the archive
+                chunks.close()
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            response = Response(itertools.chain([first], chunks), mimetype=mimetype)
+            response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+            response.call_on_close(cleanup)
+            return response
+        except ValueError as e:
+            # e.g. a page selection beyond the end of the document
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
+            shutil.rmtree(work_dir, ignore_errors=True)
             return jsonify({'error': str(e)}), 500
 
+    # Conversion jobs, see convert_jobs.py
+    @app.route('/api/convert/jobs', methods=['POST'])
+    @login_required
+    def api_convert_job_submit():
+        files = request.files.getlist('files')
+        if not files:
+            return jsonify({'error': 'Keine Dateien hochgeladen'}), 400
+        target_format = request.form.get('targetFormat', 'pdf').lower()
+        try:
+            job_id = convert_jobs.submit(current_user.id, target_format, files, convert_options(request.form))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(convert_jobs.status(job_id, current_user.id)), 202
+
+    @app.route('/api/convert/jobs/<job_id>', methods=['GET'])
+    @login_required
+    def api_convert_job_status(job_id):
+        status = convert_jobs.status(job_id, current_user.id)
+        if not status:
+            return jsonify({'error': 'Auftrag nicht gefunden'}), 404
+        return jsonify(status)
+
+    @app.route('/api/convert/jobs/<job_id>/result', methods=['GET'])
+    @login_required
+    def api_convert_job_result(job_id):
+        result = convert_jobs.result(job_id, current_user.id)
+        if not result:
+            return jsonify({'error': 'Kein Ergebnis vorhanden'}), 404
+        path, download_name, mimetype = result
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name)
+
+    @app.route('/api/convert/jobs/<job_id>', methods=['DELETE'])
+    @login_required
+    def api_convert_job_cancel(job_id):
+        status = convert_jobs.cancel(job_id, current_user.id)
+        if not status:
+            return jsonify({'error': 'Auftrag nicht gefunden'}), 404
+        return jsonify(status)
+
     @app.route('/<path:slug>')
     def catch_all_redirect(slug):
-        # Check if the slug exists in our shortlinks
-        link = Shortlink.query.filter_by(slug=slug.lower()).first()
+        # Known slugs are already answered by shortlink_fast_path
+        link = slug_index.lookup(slug)
         if link:
-            return redirect(link.target_url)
+            click_counter.record(link[0])
+            return redirect(link[1])
         # If not found, you might want to show a 404 or redirect back to index
         return redirect(url_for('index'))
 
@@ -1738,6 +1923,7 @@ def create_app():
             )
             
         elif fmt == 'pdf':
+            pisa = deps.get('pisa')
             if not pisa:
                 return jsonify({'error': 'PDF export not available (missing dependencies)'}), 500
             
@@ -1774,7 +1960,7 @@ def create_app():
             )
             
         elif fmt == 'docx':
-            doc = Document()
+            doc = deps.load('docx').Document()
             for line in content.split('\n'):
                 if line.startswith('# '):
                     doc.add_heading(line[2:], level=1)
@@ -1819,9 +2005,10 @@ def create_app():
         mimetype = "text/plain"
         
         try:
+            Document = deps.load('docx').Document
             if action == 'convert_to_docx':
                 if ext == '.pdf':
-                    cv = PDF2Docx(temp_in)
+                    cv = deps.load('pdf2docx')(temp_in)
                     temp_out = temp_in + '.docx'
                     cv.convert(temp_out)
                     cv.close()
@@ -1851,14 +2038,14 @@ def create_app():
                      with open(temp_in, 'r', encoding='utf-8', errors='ignore') as f:
                          text_content = f.read()
                  html = f"<html><body><pre>{text_content}</pre></body></html>"
-                 pisa.CreatePDF(io.BytesIO(html.encode('utf-8')), dest=output_buffer)
+                 deps.load('pisa').CreatePDF(io.BytesIO(html.encode('utf-8')), dest=output_buffer)
                  out_name = "converted.pdf"
                  mimetype = "application/pdf"
 
             elif action == 'extract_html':
                 text_content = ""
                 if ext == '.pdf':
-                    doc = fitz.open(temp_in)
+                    doc = deps.load('fitz').open(temp_in)
                     for page in doc:
                         text_content += page.get_text()
                 elif ext == '.docx':
@@ -1873,7 +2060,7 @@ def create_app():
             else: 
                  text_content = ""
                  if ext == '.pdf':
-                    doc = fitz.open(temp_in)
+                    doc = deps.load('fitz').open(temp_in)
                     for page in doc:
                         text_content += page.get_text()
                  elif ext == '.docx':
@@ -1918,6 +2105,8 @@ def create_app():
         
         try:
             count = 0
+            cv2 = deps.get('cv2') if censor_faces else None
+            nlp = deps.get('spacy_de') if censor_names else None
             
             if ext in ['.jpg', '.jpeg', '.png', '.bmp', '.webp']:
                 # Image processing
@@ -1926,6 +2115,7 @@ def create_app():
                 
                 if cv2 and censor_faces:
                     # Face detection and blurring
+                    np = deps.load('numpy')
                     img_array = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
                     face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
                     gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY)
@@ -1973,11 +2163,11 @@ def create_app():
                 text_content = ""
                 
                 if ext == '.pdf':
-                    doc = fitz.open(temp_in)
+                    doc = deps.load('fitz').open(temp_in)
                     for page in doc:
                         text_content += page.get_text()
                 elif ext == '.docx':
-                    doc = Document(temp_in)
+                    doc = deps.load('docx').Document(temp_in)
                     text_content = "\n".join([p.text for p in doc.paragraphs])
                 else:
                     with open(temp_in, 'r', encoding='utf-8', errors='ignore') as f:
@@ -2070,60 +2260,98 @@ def create_app():
     def lorem_ipsum():
         return render_template('tools/lorem_ipsum.html')
 
+    # Optional warm-up of tool backends (DEPS_WARMUP=fitz,yt_dlp or "all")
+    deps.warm_up()
+
     return app
 
 app = create_app()
 
+print(f"[Startup] App ready in {(time.perf_counter() - _startup_started) * 1000:.0f} ms")
+deps.print_report()
+
 def cleanup_job():
     with app.app_context():
-        try:
-            retention_conf = SystemConfig.query.filter_by(key='file_retention_minutes').first()
-            if not retention_conf:
-                return
-            
-            minutes = int(retention_conf.value)
-            
-            # If retention is 0 (Immediate), we still clean up files older than 5 mins to catch abandoned ones
-            min_age_minutes = max(minutes, 5) if minutes == 0 else minutes
-            
-            cutoff_time = time.time() - (min_age_minutes * 60)
-            
-            temp_dir = tempfile.gettempdir()
-            # Only delete L8teTools related files
-            files = glob.glob(os.path.join(temp_dir, "l8te_*"))
-            
-            count = 0
-            for f in files:
+        minutes = system_config.get('file_retention_minutes')
+        
+        # If retention is 0 (Immediate), we still clean up files older than 5 mins to catch abandoned ones
+        min_age_minutes = max(minutes, 5) if minutes == 0 else minutes
+        
+        cutoff_time = time.time() - (min_age_minutes * 60)
+        
+        temp_dir = tempfile.gettempdir()
+        # Only delete L8teTools related files
+        files = glob.glob(os.path.join(temp_dir, "l8te_*"))
+        
+        count = 0
+        for f in files:
+            try:
+                if os.path.getmtime(f) < cutoff_time:
+                    os.remove(f)
+                    count += 1
+            except:
+                pass
+        
+        # Also clean local downloads dir
+        download_dir = os.path.join(tempfile.gettempdir(), 'l8te_downloads')
+        if os.path.exists(download_dir):
+            for f in glob.glob(os.path.join(download_dir, "*")):
                 try:
                     if os.path.getmtime(f) < cutoff_time:
                         os.remove(f)
                         count += 1
                 except:
                     pass
-            
-            # Also clean local downloads dir
-            download_dir = os.path.join(tempfile.gettempdir(), 'l8te_downloads')
-            if os.path.exists(download_dir):
-                for f in glob.glob(os.path.join(download_dir, "*")):
-                    try:
-                        if os.path.getmtime(f) < cutoff_time:
-                            os.remove(f)
-                            count += 1
-                    except:
-                        pass
 
-            if count > 0:
-                print(f"[Cleanup] Removed {count} old temporary files.")
-                
-        except Exception as e:
-            print(f"[Cleanup] Error: {e}")
+        # Abandoned chunked uploads
+        stale = UploadSession.query.filter(UploadSession.updated_at < datetime.now() - uploads.SESSION_MAX_AGE).all()
+        for upload in stale:
+            uploads.discard(upload.filepath)
+            db.session.delete(upload)
+            count += 1
+        DownloadSession.query.filter(DownloadSession.last_seen_at < datetime.now() - DOWNLOAD_SESSION_WINDOW).delete()
+        db.session.commit()
+
+        # Converter jobs past their TTL
+        count += app.extensions['convert_jobs'].purge()
 
-# Scheduler setup
-scheduler = BackgroundScheduler()
-scheduler.add_job(func=cleanup_job, trigger="interval", minutes=60)
-scheduler.start()
+        if count > 0:
+            print(f"[Cleanup] Removed {count} old temporary files.")
+        return f"{count} Dateien entfernt"
+
+def share_expiry_job():
+    with app.app_context():
+        counts = share_expiry.sweep(db.session, datetime.now() - DOWNLOAD_SESSION_WINDOW)
+    if counts['expired'] or counts['exhausted']:
+        print(f"[Share] Removed {counts['expired']} expired and {counts['exhausted']} used-up shares.")
+    return f"{counts['expired']} abgelaufen, {counts['exhausted']} aufgebraucht"
+
+def share_scan_job():
+    count = app.extensions['scan_queue'].resubmit_stale()
+    return f"{count} Freigaben erneut geprüft"
+
+def record_job_run(**run):
+    with app.app_context():
+        db.session.add(JobRun(**run))
+        # Keep only the most recent history
+        newest = db.session.query(db.func.max(JobRun.id)).scalar() or 0
+        JobRun.query.filter(JobRun.id <= newest - 500).delete()
+        db.session.commit()
+
+# Scheduler setup: every process competes for the leader lock, only the
+# leader runs the jobs. manage.py and one-off scripts set SCHEDULER_ENABLED=false.
+scheduler = LeaderScheduler(app.config['SCHEDULER_LOCK_FILE'], record_run=record_job_run)
+scheduler.add_job(cleanup_job, 'cleanup', minutes=60)
+scheduler.add_job(share_scan_job, 'share-scan', minutes=10)
+scheduler.add_job(share_expiry_job, 'share-expiry', minutes=5)
+if os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true':
+    scheduler.start()
 
 if __name__ == '__main__':
+    # Turn SIGTERM (docker stop) into a normal exit so atexit hooks flush pending counters
+    import signal
+    import sys
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
     is_debug = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
     app.run(host='0.0.0.0', port=5000, debug=is_debug)
-
@@ -0,0 +1,143 @@
+"""
+Leader-elected background scheduler for L8teTools.
+
+Every process that imports the app (each gunicorn worker, manage.py, the
+Flask reloader) used to start its own APScheduler, so periodic jobs ran once
+per process. Here the processes compete for an exclusive lock on a file in
+the instance folder: only the holder starts the APScheduler, all other
+processes retry periodically as standbys. The kernel drops the lock when the
+leader exits or crashes, so a standby takes over within `retry_seconds`.
+
+Every job run is reported to `record_run` so the history can be stored in
+the database and shown in the settings page.
+"""
+
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, run as single-process dev setup
+    fcntl = None
+
+
+def process_identity():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def read_leader(lock_path):
+    """Return the identity written by the current leader, or None."""
+    try:
+        with open(lock_path, 'r') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class LeaderScheduler:
+    def __init__(self, lock_path, record_run=None, retry_seconds=30):
+        self.lock_path = lock_path
+        self.record_run = record_run
+        self.retry_seconds = retry_seconds
+        self.identity = process_identity()
+        self.is_leader = False
+        self._jobs = []
+        self._lock_file = None
+        self._scheduler = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_job(self, func, name, **interval):
+        """Register a job, e.g. add_job(cleanup_job, 'cleanup', minutes=60)."""
+        self._jobs.append((func, name, interval))
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._elect_loop, name='leader-election', daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._scheduler:
+            self._scheduler.shutdown(wait=False)
+            self._scheduler = None
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_leader = False
+
+    def run_job(self, name):
+        """Run a registered job immediately in the calling thread."""
+        for func, job_name, _ in self._jobs:
+            if job_name == name:
+                return self._run(func, job_name)
+        raise KeyError(name)
+
+    # ── Internals ────────────────────────────────────────────────────
+    def _try_acquire(self):
+        if fcntl is None:
+            return True
+
+        lock_file = open(self.lock_path, 'a+')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(self.identity)
+        lock_file.flush()
+        self._lock_file = lock_file
+        return True
+
+    def _elect_loop(self):
+        while not self._stop.is_set():
+            try:
+                if self._try_acquire():
+                    self._become_leader()
+                    return
+            except Exception as e:
+                print(f"[Scheduler] Leader election failed: {e}")
+            self._stop.wait(self.retry_seconds)
+
+    def _become_leader(self):
+        self.is_leader = True
+        self._scheduler = BackgroundScheduler()
+        for func, name, interval in self._jobs:
+            self._scheduler.add_job(func=self._run, args=(func, name), trigger="interval",
+                                    id=name, max_instances=1, coalesce=True, **interval)
+        self._scheduler.start()
+        print(f"[Scheduler] {self.identity} is now the leader, running {len(self._jobs)} job(s).")
+
+    def _run(self, func, name):
+        started_at = datetime.now()
+        start = time.perf_counter()
+        status, message = 'ok', None
+        try:
+            message = func()
+        except Exception as e:
+            status, message = 'error', str(e)
+            traceback.print_exc()
+
+        if self.record_run:
+            try:
+                self.record_run(
+                    job_name=name,
+                    started_at=started_at,
+                    duration_ms=int((time.perf_counter() - start) * 1000),
+                    status=status,
+                    message=str(message)[:255] if message is not None else None,
+                    host=self.identity,
+                )
+            except Exception as e:
+                print(f"[Scheduler] Could not record run of {name}: {e}")
+        return message
@@ -0,0 +1,133 @@
+"""
+Content-addressed storage for shared files.
+
+The same installers and PDFs get shared again and again, and every upload
+used to leave its own `uuid_filename` copy in UPLOAD_FOLDER. Shared files
+are now stored once per content under
+
+    UPLOAD_FOLDER/blobs/<sha256[:2]>/<sha256>
+
+and `SharedFile.filepath` points at that blob, so public_server.py serves
+it like any other file. The `blob` table keeps one row per content with a
+reference count; every `SharedFile` with `blob_sha256` set holds one
+reference:
+
+- `store()` moves a finished upload into the store, or drops it if the
+  content is already there, and takes a reference
+- `release()` gives a reference back; the blob file is removed only when
+  the last one goes away. Shares from before the store (no hash) just
+  have their own file removed, as before
+
+The hash is computed while the upload streams in (`HashingWriter`); only
+chunked uploads and ZIP archives, which are not written sequentially in
+one request, are hashed from disk. File operations happen while the row
+is write-locked, so a release and a store of the same content cannot
+interleave. Only plain SQL is used, so public_server.py and file_scan.py
+can call this without the app's models.
+"""
+
+import hashlib
+import os
+
+from sqlalchemy import text
+
+READ_BLOCK = 1024 * 1024
+
+
+class HashingWriter:
+    """File wrapper that hashes everything written through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def close(self):
+        self.f.close()
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(READ_BLOCK)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def blob_path(upload_folder, sha256):
+    return os.path.join(upload_folder, 'blobs', sha256[:2], sha256)
+
+
+def store(session, upload_folder, path, sha256=None):
+    """
+    Take a reference on the blob with the content of `path` and return
+    (sha256, blob_path). `path` is moved into the store or removed. The
+    caller commits, together with the SharedFile row holding the reference.
+    """
+    sha256 = sha256 or hash_file(path)
+    size = os.path.getsize(path)
+    target = blob_path(upload_folder, sha256)
+
+    session.execute(text('INSERT INTO blob (sha256, size, ref_count, created_at) '
+                         'VALUES (:sha, :size, 1, CURRENT_TIMESTAMP) '
+                         'ON CONFLICT (sha256) DO UPDATE SET ref_count = ref_count + 1'),
+                    {'sha': sha256, 'size': size})
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return sha256, target
+
+
+def release(session, sha256, path, references=1):
+    """
+    Give back `references` taken by `store()`, removing the blob file with
+    the last one. Without a hash `path` is a legacy per-share file and is
+    removed directly. The caller commits.
+    """
+    if not sha256:
+        _remove(path)
+        return True
+
+    session.execute(text('UPDATE blob SET ref_count = ref_count - :n WHERE sha256 = :sha'),
+                    {'sha': sha256, 'n': references})
+    deleted = session.execute(text('DELETE FROM blob WHERE sha256 = :sha AND ref_count <= 0'),
+                              {'sha': sha256}).rowcount
+    if deleted:
+        _remove(path)
+    return bool(deleted)
+
+
+def _remove(path):
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def stats(session):
+    """Bytes on disk vs. bytes the shares would take without deduplication."""
+    blobs, stored, referenced, references = session.execute(text(
+        'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(size * ref_count), 0), '
+        'COALESCE(SUM(ref_count), 0) FROM blob')).one()
+    return {
+        'blobs': blobs,
+        'references': references,
+        'stored_bytes': stored,
+        'referenced_bytes': referenced,
+        'saved_bytes': referenced - stored,
+    }
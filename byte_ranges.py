@@ -0,0 +1,202 @@
+"""
+HTTP byte-range responses for file downloads.
+
+`send_file()` only supports a single range and derives its ETag from
+mtime/size/path hashing. Share downloads need more for download managers:
+
+- ETag from inode + mtime + size, so a replaced file never matches
+- `Range` with one (206) or several ranges (206 multipart/byteranges);
+  overlapping or adjacent ranges are merged
+- `If-Range` with an ETag or date: on mismatch the full file is sent
+- Unsatisfiable ranges get 416 with `Content-Range: bytes */size`
+
+Bodies are streamed from the open file in blocks, so a 1 GB share never
+sits in memory. With `offload_response()` the body is not sent by Python at
+all: a fronting web server (nginx `X-Accel-Redirect`, Apache/lighttpd
+`X-Sendfile`) sends the file with sendfile(2) and handles ranges itself.
+"""
+
+import mimetypes
+import os
+import unicodedata
+import uuid
+from urllib.parse import quote
+
+from flask import Response
+from werkzeug.http import http_date, parse_date, quote_etag, unquote_etag
+
+BLOCK = 256 * 1024
+MAX_RANGES = 16  # More parts than that is not a download manager, send the whole file
+
+
+def file_etag(stat):
+    return f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def parse_ranges(header, size):
+    """
+    Return a list of (start, end_exclusive) for a Range header, None to send
+    the full file, or [] if no range is satisfiable.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        first, _, last = spec.partition('-')
+        try:
+            if not first:
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size
+            else:
+                start = int(first)
+                end = size
+                if last:
+                    if int(last) < start:
+                        return None
+                    end = min(int(last) + 1, size)
+        except ValueError:
+            return None
+        if start < size and start < end:
+            ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _if_range_matches(header, etag, mtime):
+    if not header:
+        return True
+    header = header.strip()
+    if header.startswith('"') or header.startswith('W/'):
+        tag, weak = unquote_etag(header)
+        return not weak and tag == etag
+    date = parse_date(header)
+    return date is not None and int(mtime) <= date.timestamp()
+
+
+def _read(path, ranges):
+    with open(path, 'rb') as f:
+        for start, end in ranges:
+            f.seek(start)
+            remaining = end - start
+            while remaining:
+                block = f.read(min(BLOCK, remaining))
+                if not block:
+                    return
+                remaining -= len(block)
+                yield block
+
+
+def _multipart(path, ranges, size, mimetype, boundary):
+    with open(path, 'rb') as f:
+        for start, end in ranges:
+            yield (f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                   f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n").encode('latin-1')
+            f.seek(start)
+            remaining = end - start
+            while remaining:
+                block = f.read(min(BLOCK, remaining))
+                if not block:
+                    return
+                remaining -= len(block)
+                yield block
+        yield f"\r\n--{boundary}--\r\n".encode('latin-1')
+
+
+def _mimetype(download_name):
+    # Guessed from the name like send_file() does
+    return mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+
+def body_bytes(request, path):
+    """File bytes a GET for `path` sends: the requested ranges, or all of it (0 for 304/416)."""
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    if request.if_none_match and request.if_none_match.contains(etag):
+        return 0
+    if not _if_range_matches(request.headers.get('If-Range'), etag, stat.st_mtime):
+        return stat.st_size
+    ranges = parse_ranges(request.headers.get('Range'), stat.st_size)
+    if ranges is None:
+        return stat.st_size
+    return sum(end - start for start, end in ranges)
+
+
+def range_response(request, path, download_name, mimetype=None):
+    """Build a 200/206/304/416 response for `path`. Returns (response, ranges or None)."""
+    mimetype = mimetype or _mimetype(download_name)
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(stat)
+
+    headers = {
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, no-cache',
+    }
+
+    if request.if_none_match and request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers), None
+
+    ranges = None
+    if _if_range_matches(request.headers.get('If-Range'), etag, stat.st_mtime):
+        ranges = parse_ranges(request.headers.get('Range'), size)
+
+    if ranges == []:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers), None
+
+    if ranges is None:
+        response = Response(_read(path, [(0, size)]), status=200, mimetype=mimetype, headers=headers)
+        response.content_length = size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        response = Response(_read(path, ranges), status=206, mimetype=mimetype, headers=headers)
+        response.content_length = end - start
+    else:
+        boundary = uuid.uuid4().hex
+        length = sum(
+            len(f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n") + end - start
+            for start, end in ranges) + len(f"\r\n--{boundary}--\r\n")
+        response = Response(_multipart(path, ranges, size, mimetype, boundary), status=206,
+                                  mimetype=f'multipart/byteranges; boundary={boundary}', headers=headers)
+        response.content_length = length
+
+    response.headers.set('Content-Disposition', 'attachment', **_filename_options(download_name))
+    return response, ranges
+
+
+def offload_response(header, target, download_name, mimetype=None):
+    """Empty response telling the web server in front to send `target` itself."""
+    response = Response(status=200, mimetype=mimetype or _mimetype(download_name))
+    response.headers[header] = target
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers.set('Content-Disposition', 'attachment', **_filename_options(download_name))
+    return response
+
+
+def _filename_options(name):
+    # Same encoding as send_file(): ASCII fallback plus RFC 2231 UTF-8 name
+    try:
+        name.encode('ascii')
+        return {'filename': name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(name, safe='!#$&+^`|~')}"}
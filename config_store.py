@@ -0,0 +1,119 @@
+"""
+Cached, typed access to the SystemConfig table.
+
+All SystemConfig rows are loaded with one query and served from memory.
+Writes go through `set()`, which also bumps the `config_version` row in the
+same transaction. Other workers compare their cached version with that row
+at most every `refresh_seconds` (CONFIG_REFRESH_SECONDS) and reload when it
+changed, so an admin change reaches every process within a few seconds.
+
+Known keys and their defaults/types are declared in `SETTINGS`; unknown
+keys are returned as strings.
+"""
+
+import threading
+import time
+
+from sqlalchemy import text
+
+VERSION_KEY = 'config_version'
+
+# key -> (type, default)
+SETTINGS = {
+    'shortener_domain': (str, 'tools.l8tenever.de'),
+    'file_retention_minutes': (int, 1440),
+    'shortlinks_version': (str, '0'),
+    'identities_version': (str, '0'),
+}
+
+
+class ConfigStore:
+    def __init__(self, db, refresh_seconds=5):
+        self.db = db
+        self.refresh_seconds = refresh_seconds
+        self._values = None
+        self._version = None
+        self._checked_at = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def on_change(self, callback):
+        """Register callback(key_or_None) fired after local writes and remote reloads."""
+        self._listeners.append(callback)
+        return callback
+
+    def _notify(self, key):
+        for callback in self._listeners:
+            try:
+                callback(key)
+            except Exception as e:
+                print(f"[Config] Listener failed: {e}")
+
+    def _load(self):
+        rows = self.db.session.execute(text('SELECT key, value FROM system_config')).all()
+        values = {key: value for key, value in rows}
+        self._version = values.pop(VERSION_KEY, '0')
+        self._values = values
+        self._checked_at = time.monotonic()
+
+    def _current_version(self):
+        return self.db.session.execute(
+            text('SELECT value FROM system_config WHERE key = :key'), {'key': VERSION_KEY}
+        ).scalar() or '0'
+
+    def _ensure_fresh(self):
+        """Return the cached values, reloading them if another worker changed them."""
+        if self._values is None:
+            with self._lock:
+                if self._values is None:
+                    self._load()
+                return self._values
+
+        if time.monotonic() - self._checked_at >= self.refresh_seconds:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.refresh_seconds:
+                    if self._current_version() != self._version:
+                        self._load()
+                        self._notify(None)
+                    else:
+                        self._checked_at = time.monotonic()
+        return self._values
+
+    def get(self, key, default=None):
+        values = self._ensure_fresh()
+        kind, fallback = SETTINGS.get(key, (str, default))
+        raw = values.get(key)
+        if raw is None:
+            return fallback if default is None else default
+        try:
+            return kind(raw)
+        except (TypeError, ValueError):
+            return fallback
+
+    def _upsert(self, key, value):
+        session = self.db.session
+        updated = session.execute(text('UPDATE system_config SET value = :value WHERE key = :key'),
+                                  {'key': key, 'value': value})
+        if updated.rowcount == 0:
+            session.execute(text('INSERT INTO system_config (key, value) VALUES (:key, :value)'),
+                            {'key': key, 'value': value})
+
+    def set(self, key, value):
+        """Persist a value and bump the shared version in the same transaction."""
+        session = self.db.session
+        self._upsert(key, str(value))
+        bumped = session.execute(
+            text('UPDATE system_config SET value = CAST(CAST(value AS INTEGER) + 1 AS VARCHAR(255)) WHERE key = :key'),
+            {'key': VERSION_KEY})
+        if bumped.rowcount == 0:
+            session.execute(text('INSERT INTO system_config (key, value) VALUES (:key, :value)'),
+                            {'key': VERSION_KEY, 'value': '1'})
+        session.commit()
+
+        with self._lock:
+            self._load()
+        self._notify(key)
+
+    def invalidate(self):
+        with self._lock:
+            self._values = None
@@ -0,0 +1,475 @@
+"""
+Background jobs for the file converter.
+
+A 200-page PDF->DOCX or a video transcode used to run inside the
+/api/convert request, holding a worker for minutes until gunicorn killed
+it. Conversions are now submitted as jobs:
+
+    POST   /api/convert/jobs               files, targetFormat -> {id, state}
+    GET    /api/convert/jobs/<id>          -> {state, progress, message, ...}
+    GET    /api/convert/jobs/<id>/result   converted file
+    DELETE /api/convert/jobs/<id>          cancel
+
+Every job is a directory under the job root holding the uploaded inputs,
+`status.json` and finally the result. Because the state lives on disk, any
+worker process can answer status, result and cancel requests, not only the
+one that accepted the upload.
+
+The queue is on disk too: dispatcher threads of every process take the
+oldest 'queued' job and claim it by creating its `claim` file exclusively.
+A job submitted to a process that restarted is therefore run by another
+one (dispatchers start on the first job request a process serves, and in
+the leader with the cleanup job). A claim or a running job whose
+supervising process is gone is recovered the same way: the job is queued
+again, or marked as failed once its child has exited too. Processes are
+identified by host, pid and start time, so the app of a restarted
+container (same hostname, PID 1 again) is not mistaken for its
+predecessor.
+
+At most `workers` conversions (default: number of CPU cores) run at a time
+on the whole host, however many web processes share the job root: a
+dispatcher first takes one of `workers` slot files under `.slots`
+(created exclusively, like claims, and dropped when their owner is gone)
+and only then claims a job. A conversion runs in its own child process (converter.py),
+which writes its progress to `status.json`; the dispatcher thread only
+waits for it. The child is a fresh interpreter (`python -m convert_jobs
+<job_dir>`), not a fork of the web process: a fork would inherit the
+scheduler's leader lock and every other open file, and locks that another
+thread happened to hold (e.g. in lazy_deps), which then never get
+released. It also starts a session of its own, so ffmpeg and the PDF
+render workers it starts are in its process group. Cancelling drops a
+marker file: a queued job is skipped, a running one is stopped by
+signalling the whole group, SIGTERM first and SIGKILL after
+`KILL_GRACE_SECONDS`. Jobs running longer than `timeout` are stopped the
+same way. Finished jobs are removed `ttl` after their last update by
+`purge()`, called from the cleanup job.
+
+PDF page rendering inside a job uses its own worker processes
+(pdf_raster.py). The `render_workers` cores (default: all) are split
+between the jobs running at the moment a job starts, so a single job gets
+the whole machine and a full queue does not start workers × cores
+processes.
+"""
+
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from werkzeug.utils import secure_filename
+
+import converter
+
+TERMINAL_STATES = ('done', 'error', 'cancelled')
+KILL_GRACE_SECONDS = 5
+# How often idle dispatchers look for jobs queued by other processes
+POLL_SECONDS = 2
+
+
+# ── Job directory helpers ───────────────────────────────────────────────
+def read_status(job_dir):
+    try:
+        with open(os.path.join(job_dir, 'status.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_status(job_dir, **changes):
+    status = read_status(job_dir) or {}
+    status.update(changes, updated_at=datetime.now().isoformat(timespec='seconds'))
+    # Readers in other processes must never see a half-written file
+    tmp = os.path.join(job_dir, f'status.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp, os.path.join(job_dir, 'status.json'))
+    return status
+
+
+def _cancel_requested(job_dir):
+    return os.path.exists(os.path.join(job_dir, 'cancel'))
+
+
+def _start_time(pid):
+    """Start time of `pid` in clock ticks since boot (Linux), or None."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name (field 2) may contain spaces and parentheses
+    fields = stat.rpartition(')')[2].split()
+    return fields[19] if len(fields) > 19 else None
+
+
+def process_identity(pid=None):
+    """
+    "host:pid:start time". The start time tells a restarted container
+    apart: it has the same hostname, its app is PID 1 again, and the job
+    root in /tmp survived.
+    """
+    pid = pid or os.getpid()
+    start = _start_time(pid)
+    return f"{socket.gethostname()}:{pid}" + (f":{start}" if start else '')
+
+
+def _process_gone(identity):
+    """True if `identity` is a process of this host that no longer exists."""
+    host, _, rest = (identity or '').partition(':')
+    pid, _, start = rest.partition(':')
+    # os.kill(pid, 0) would terminate the process on Windows
+    if host != socket.gethostname() or not pid.isdigit() or not hasattr(os, 'killpg'):
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    # The pid exists, but may belong to another process by now
+    current = _start_time(pid)
+    return bool(start and current and current != start)
+
+
+def _run_job(job_dir, render_workers=1):
+    """Body of the child process."""
+    status = read_status(job_dir)
+    options = dict(status.get('options') or {}, render_workers=render_workers)
+    inputs = [(os.path.join(job_dir, 'in', stored), name) for stored, name in status['inputs']]
+    last_write = 0
+
+    def progress(fraction, message=None):
+        nonlocal last_write
+        if _cancel_requested(job_dir):
+            raise converter.Cancelled()
+        # Status writes are cheap but not free: at most a few per second
+        now = time.monotonic()
+        if now - last_write >= 0.25 or fraction >= 1:
+            last_write = now
+            write_status(job_dir, progress=round(fraction, 3), message=message)
+
+    out_dir = os.path.join(job_dir, 'out')
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        path = converter.convert(inputs, status['target_format'], out_dir, progress, options)
+        write_status(job_dir, state='done', progress=1.0, message=None, result=os.path.basename(path))
+    except converter.Cancelled:
+        write_status(job_dir, state='cancelled', message=None)
+    except Exception as e:
+        write_status(job_dir, state='error', error=str(e)[:500])
+    finally:
+        shutil.rmtree(os.path.join(job_dir, 'in'), ignore_errors=True)
+
+
+class ConvertJobs:
+    def __init__(self, root, workers=None, ttl=timedelta(hours=1), timeout=3600, render_workers=None):
+        self.root = os.path.abspath(root)
+        self.workers = workers or os.cpu_count() or 1
+        self.render_workers = render_workers or os.cpu_count() or 1
+        self._running = 0
+        self.ttl = ttl
+        self.timeout = timeout
+        self.identity = process_identity()
+        self.slots = os.path.join(self.root, '.slots')
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        os.makedirs(self.slots, exist_ok=True)
+
+    # ── Public API ───────────────────────────────────────────────────
+    def submit(self, user_id, target_format, files, options=None):
+        """
+        Store the uploaded files (FileStorage) and queue the job. `options`
+        are passed on to converter.convert. Returns the job id.
+        """
+        if target_format not in converter.OUTPUTS:
+            raise ValueError(f"Unbekanntes Zielformat: {target_format}")
+
+        job_id = uuid.uuid4().hex
+        job_dir = self._dir(job_id)
+        os.makedirs(os.path.join(job_dir, 'in'))
+        inputs = []
+        for i, file in enumerate(files):
+            stored = f"{i}_{secure_filename(file.filename) or 'datei'}"
+            file.save(os.path.join(job_dir, 'in', stored))
+            inputs.append((stored, file.filename))
+
+        download_name, mimetype = converter.OUTPUTS[target_format]
+        write_status(job_dir, id=job_id, user_id=user_id, state='queued', progress=0.0, message=None,
+                     error=None, target_format=target_format, inputs=inputs, options=options or {},
+                     download_name=download_name, mimetype=mimetype,
+                     created_at=datetime.now().isoformat(timespec='seconds'))
+        self._start_workers()
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id, user_id):
+        """Public status of a job of `user_id`, or None."""
+        status = self._status(job_id, user_id)
+        if status is None:
+            return None
+        return {key: status.get(key) for key in
+                ('id', 'state', 'progress', 'message', 'error', 'download_name', 'created_at', 'updated_at')}
+
+    def result(self, job_id, user_id):
+        """(path, download_name, mimetype) of a finished job, or None."""
+        status = self._status(job_id, user_id)
+        if not status or status['state'] != 'done':
+            return None
+        path = os.path.join(self._dir(job_id), 'out', status['result'])
+        if not os.path.isfile(path):
+            return None
+        return path, status['download_name'], status['mimetype']
+
+    def cancel(self, job_id, user_id):
+        status = self._status(job_id, user_id)
+        if status is None:
+            return None
+        if status['state'] not in TERMINAL_STATES:
+            # Picked up by whichever process queued or runs the job
+            open(os.path.join(self._dir(job_id), 'cancel'), 'w').close()
+        return self.status(job_id, user_id)
+
+    def purge(self):
+        """
+        Remove finished jobs whose last update is older than the TTL. Queued
+        and running jobs are left alone. Returns the number removed.
+        """
+        # Also makes sure jobs queued by processes that are gone get a dispatcher
+        self._start_workers()
+        cutoff = time.time() - self.ttl.total_seconds()
+        removed = 0
+        for name in os.listdir(self.root):
+            if name.startswith('.'):
+                continue
+            job_dir = os.path.join(self.root, name)
+            status_path = os.path.join(job_dir, 'status.json')
+            try:
+                if os.path.exists(status_path):
+                    if (read_status(job_dir) or {}).get('state') not in TERMINAL_STATES:
+                        continue
+                    modified = os.path.getmtime(status_path)
+                else:
+                    # Upload of a submit that never finished
+                    modified = os.path.getmtime(job_dir)
+                if modified < cutoff:
+                    shutil.rmtree(job_dir)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    # ── Internals ────────────────────────────────────────────────────
+    def _dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def _status(self, job_id, user_id):
+        if not job_id.isalnum():
+            return None
+        status = read_status(self._dir(job_id))
+        if not status or status.get('user_id') != user_id:
+            return None
+        if status['state'] in TERMINAL_STATES and \
+                datetime.fromisoformat(status['updated_at']) < datetime.now() - self.ttl:
+            return None
+        # A process serving job requests also runs jobs, including ones left by others
+        self._start_workers()
+        return status
+
+    def _start_workers(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._dispatch, name=f'convert-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _dispatch(self):
+        while True:
+            slot = job_id = None
+            try:
+                slot = self._take_slot()
+                if slot:
+                    job_id = self._claim_next()
+            except Exception as e:
+                print(f"[Convert] Looking for jobs failed: {e}")
+            if job_id is None:
+                self._release_slot(slot)
+                self._wakeup.wait(POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print(f"[Convert] Job {job_id} failed: {e}")
+            finally:
+                self._release_slot(slot)
+
+    def _take_slot(self):
+        """One of the host-wide `workers` slots, as the path of its file, or None."""
+        for i in range(self.workers):
+            slot = os.path.join(self.slots, str(i))
+            try:
+                fd = os.open(slot, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(slot) as f:
+                        owner = f.read().strip()
+                except OSError:
+                    continue
+                if _process_gone(owner):
+                    # Held by a process that died; free for the next round
+                    _remove(slot)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.identity)
+            return slot
+        return None
+
+    def _release_slot(self, slot):
+        if slot:
+            _remove(slot)
+
+    def _claim_next(self):
+        """Claim the oldest queued job. Returns its id or None."""
+        queued = []
+        for job_id in os.listdir(self.root):
+            if job_id.startswith('.'):
+                continue
+            status = read_status(self._dir(job_id))
+            if not status:
+                continue
+            if status['state'] == 'queued':
+                queued.append((status['created_at'], job_id))
+            elif status['state'] == 'running' and _process_gone(status.get('supervisor')):
+                self._recover(job_id, status)
+
+        for _, job_id in sorted(queued):
+            claim = os.path.join(self._dir(job_id), 'claim')
+            try:
+                fd = os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(claim) as f:
+                        owner = f.read().strip()
+                except OSError:
+                    continue
+                if _process_gone(owner):
+                    # Claimed by a process that died before starting the job
+                    os.remove(claim)
+                continue
+            except OSError:
+                # Removed in the meantime
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.identity)
+            return job_id
+        return None
+
+    def _recover(self, job_id, status):
+        """A running job whose supervising process is gone."""
+        job_dir = self._dir(job_id)
+        child = status.get('child')
+        error = 'Konvertierung abgebrochen (Server neu gestartet)'
+        if child and not _process_gone(child):
+            # The child outlives its supervisor and finishes on its own; only
+            # the timeout is enforced here
+            if datetime.now() - datetime.fromisoformat(status['started_at']) < timedelta(seconds=self.timeout):
+                return
+            _signal_group(status['child_pid'], signal.SIGKILL)
+            error = 'Zeitlimit überschritten'
+        if (read_status(job_dir) or {}).get('state') == 'running':
+            write_status(job_dir, state='error', error=error)
+        shutil.rmtree(os.path.join(job_dir, 'in'), ignore_errors=True)
+        shutil.rmtree(os.path.join(job_dir, 'out'), ignore_errors=True)
+
+    def _run(self, job_id):
+        job_dir = self._dir(job_id)
+        if not os.path.isdir(job_dir):
+            return
+        if _cancel_requested(job_dir):
+            write_status(job_dir, state='cancelled')
+            shutil.rmtree(os.path.join(job_dir, 'in'), ignore_errors=True)
+            return
+
+        write_status(job_dir, state='running', supervisor=self.identity,
+                     started_at=datetime.now().isoformat(timespec='seconds'))
+        with self._lock:
+            self._running += 1
+            render_workers = max(1, self.render_workers // self._running)
+        try:
+            self._supervise(job_id, job_dir, render_workers)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _supervise(self, job_id, job_dir, render_workers):
+        # close_fds (the default) keeps the leader lock and sockets out of the child
+        process = subprocess.Popen([sys.executable, '-m', 'convert_jobs', job_dir, str(render_workers)],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdin=subprocess.DEVNULL, start_new_session=True)
+        write_status(job_dir, child_pid=process.pid, child=process_identity(process.pid))
+        deadline = time.monotonic() + self.timeout
+        stopped = None
+        while True:
+            try:
+                process.wait(0.5)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if _cancel_requested(job_dir):
+                stopped = ('cancelled', None)
+            elif time.monotonic() > deadline:
+                stopped = ('error', 'Zeitlimit überschritten')
+            if stopped:
+                _stop(process)
+                break
+
+        if stopped:
+            write_status(job_dir, state=stopped[0], error=stopped[1])
+        elif (read_status(job_dir) or {}).get('state') not in TERMINAL_STATES:
+            # The child died without reporting (e.g. killed for memory)
+            write_status(job_dir, state='error', error=f'Konvertierung abgebrochen (Exit-Code {process.returncode})')
+        shutil.rmtree(os.path.join(job_dir, 'in'), ignore_errors=True)
+        if read_status(job_dir).get('state') != 'done':
+            shutil.rmtree(os.path.join(job_dir, 'out'), ignore_errors=True)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _signal_group(pgid, sig):
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def _stop(process):
+    """Stop a job child together with everything it started (ffmpeg, render workers)."""
+    if not hasattr(os, 'killpg'):
+        process.kill()
+        process.wait()
+        return
+    _signal_group(process.pid, signal.SIGTERM)
+    try:
+        process.wait(KILL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        pass
+    # Whatever of the group is still alive, also after the child itself exited
+    _signal_group(process.pid, signal.SIGKILL)
+    process.wait()
+
+
+if __name__ == '__main__':
+    _run_job(sys.argv[1], int(sys.argv[2]))
@@ -0,0 +1,278 @@
+"""
+Conversion backends of the file converter.
+
+This used to live inline in `api_convert`, working on uploaded files in
+memory inside the HTTP request. It now works on files on disk and has no
+Flask dependency, so the same code runs in the synchronous /api/convert
+and in the worker processes of convert_jobs.py.
+
+Images become PDF pages through img2pdf without re-encoding where the
+format allows: JPEG data is embedded as-is and PNG/TIFF/GIF/BMP without
+transparency are stored losslessly. Only HEIC, WebP and images with an
+alpha channel are decoded, once (see `_pdf_image_source`). A run of images
+is turned into one multi-page PDF in a single img2pdf call.
+
+`convert(inputs, target_format, out_dir, progress)` takes a list of
+`(path, original_name)` and writes one result file: a PDF for target 'pdf',
+otherwise a ZIP with one entry per converted file or page. The branches are
+generators of `(entry_name, bytes or path)`, so the caller decides how the
+entries are packed; /api/convert streams them (zip_stream.py). `progress(fraction, message)` is called between steps;
+it may raise `Cancelled` to stop the conversion. `options` holds the
+settings of PDF page rendering (pdf_raster.py): `dpi`, `pages` as parsed
+by `pdf_raster.parse_pages` and `render_workers`, and of audio/video
+conversion (media_transcode.py): `ffmpeg_threads` (default: the
+`render_workers` cores) and `ffmpeg_preset`.
+"""
+
+import io
+import os
+
+from PIL import Image
+
+import media_transcode
+import pdf_raster
+import zip_stream
+from lazy_deps import deps
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.tiff', '.heic')
+
+# target format -> (download name, mimetype)
+OUTPUTS = {
+    'pdf': ('converted.pdf', 'application/pdf'),
+    'png': ('converted_images.zip', 'application/zip'),
+    'jpg': ('converted_images.zip', 'application/zip'),
+    'webp': ('converted_images.zip', 'application/zip'),
+    'docx': ('converted_docs.zip', 'application/zip'),
+    'txt': ('converted_docs.zip', 'application/zip'),
+    'mp3': ('converted_media.zip', 'application/zip'),
+    'wav': ('converted_media.zip', 'application/zip'),
+    'ogg': ('converted_media.zip', 'application/zip'),
+    'mp4': ('converted_media.zip', 'application/zip'),
+    'mov': ('converted_media.zip', 'application/zip'),
+}
+
+
+# img2pdf embeds these as they are (JPEG) or recompresses them losslessly
+IMG2PDF_FORMATS = ('JPEG', 'MPO', 'PNG', 'TIFF', 'GIF', 'BMP')
+# Decoded sources re-encoded as JPEG; everything else that needs decoding becomes PNG
+PHOTO_FORMATS = ('HEIF', 'WEBP')
+PHOTO_QUALITY = 95
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _no_progress(fraction, message=None):
+    pass
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# ── Branches ────────────────────────────────────────────────────────────
+def _flatten(img):
+    """RGB/L image; transparent areas become white like on a printed page."""
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    if img.mode not in ('RGB', 'L'):
+        return img.convert('RGB')
+    return img
+
+
+def _pdf_image_source(path):
+    """
+    What to hand to img2pdf for one image: the file itself if img2pdf can
+    embed it losslessly, else the image decoded once and re-encoded.
+    Only the header is read to decide.
+    """
+    with Image.open(path) as img:
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        if img.format in IMG2PDF_FORMATS and not has_alpha and img.mode in ('RGB', 'L', '1', 'P', 'CMYK'):
+            return path
+        fmt = img.format
+        img = _flatten(img)
+        out = io.BytesIO()
+        if fmt in PHOTO_FORMATS:
+            img.save(out, format='JPEG', quality=PHOTO_QUALITY)
+        else:
+            img.save(out, format='PNG')
+        return out.getvalue()
+
+
+def _decoded_png(path):
+    with Image.open(path) as img:
+        out = io.BytesIO()
+        _flatten(img).save(out, format='PNG')
+        return out.getvalue()
+
+
+def _images_to_pdf(paths, progress=_no_progress):
+    """One img2pdf call for all `paths`, one page per image."""
+    img2pdf = deps.load('img2pdf')
+    sources = []
+    for i, path in enumerate(paths):
+        progress(i / len(paths), f"Bild {i + 1} von {len(paths)}")
+        sources.append(_pdf_image_source(path))
+    try:
+        return img2pdf.convert(sources)
+    except Exception:
+        # Something img2pdf could not embed after all: decode the rest too
+        return img2pdf.convert([s if isinstance(s, bytes) else _decoded_png(s) for s in sources])
+
+
+def pdf_document(inputs, progress=_no_progress):
+    """Merge images, SVGs, text and PDFs into one PDF. Returns the PDF bytes."""
+    deps.get('heif')
+
+    # Consecutive images form one part, every other input is a part of its own
+    parts = []
+    for path, name in inputs:
+        filename = name.lower()
+        if filename.endswith(IMAGE_EXTENSIONS):
+            if parts and parts[-1][0] == 'images':
+                parts[-1][1].append(path)
+            else:
+                parts.append(('images', [path]))
+        elif filename.endswith(('.svg', '.md', '.txt', '.pdf')):
+            parts.append((os.path.splitext(filename)[1], path))
+
+    if len(parts) == 1 and parts[0][0] == 'images':
+        # Only images: img2pdf's output is the result, nothing to merge
+        return _images_to_pdf(parts[0][1], progress)
+
+    fitz = deps.load('fitz')
+    doc = fitz.open()
+    for i, (kind, source) in enumerate(parts):
+        progress(i / len(parts), None)
+        if kind == 'images':
+            part = fitz.open("pdf", _images_to_pdf(source))
+        elif kind == '.svg':
+            part = fitz.open("pdf", deps.load('cairosvg').svg2pdf(bytestring=_read(source)))
+        elif kind in ('.md', '.txt'):
+            part = fitz.open()
+            part.new_page().insert_text((50, 50), _read(source).decode('utf-8', errors='ignore'))
+        else:
+            part = fitz.open(source)
+        doc.insert_pdf(part)
+        part.close()
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def image_entries(inputs, target_format, progress=_no_progress, options=None):
+    options = options or {}
+    deps.get('heif')
+    cairosvg = deps.get('cairosvg')
+
+    for i, (path, name) in enumerate(inputs):
+        progress(i / len(inputs), name)
+        filename = name.lower()
+
+        if filename.endswith('.pdf'):
+            pages = pdf_raster.select_pages(options.get('pages'), pdf_raster.page_count(path))
+            rendered = pdf_raster.render(path, target_format, options.get('dpi', pdf_raster.DEFAULT_DPI),
+                                         pages, options.get('render_workers', 1))
+            try:
+                for done, (page_num, data) in enumerate(rendered):
+                    progress((i + done / len(pages)) / len(inputs), f"{name}: Seite {page_num + 1}")
+                    yield f"file_{i}_page_{page_num}.{target_format}", data
+            finally:
+                rendered.close()
+            continue
+
+        file_data = _read(path)
+        if filename.endswith('.svg'):
+            img = Image.open(io.BytesIO(cairosvg.svg2png(bytestring=file_data)))
+            img_byte_arr = io.BytesIO()
+            img.save(img_byte_arr, format=target_format.upper())
+            yield f"file_{i}.{target_format}", img_byte_arr.getvalue()
+        else:
+            img = Image.open(io.BytesIO(file_data))
+            if target_format in ['jpg', 'jpeg'] and img.mode != 'RGB':
+                img = img.convert('RGB')
+            img_byte_arr = io.BytesIO()
+            img.save(img_byte_arr, format=target_format.upper())
+            yield f"file_{i}.{target_format}", img_byte_arr.getvalue()
+
+
+def document_entries(inputs, target_format, work_dir, progress=_no_progress):
+    for i, (path, name) in enumerate(inputs):
+        progress(i / len(inputs), name)
+        filename = name.lower()
+
+        if target_format == 'docx' and filename.endswith('.pdf'):
+            out_path = os.path.join(work_dir, f"file_{i}.docx")
+            try:
+                cv = deps.load('pdf2docx')(path)
+                cv.convert(out_path)
+                cv.close()
+                yield f"file_{i}.docx", out_path
+            finally:
+                _remove(out_path)
+        elif target_format == 'txt':
+            if filename.endswith('.pdf'):
+                pdf_doc = deps.load('fitz').open(path)
+                text = ""
+                for page in pdf_doc:
+                    text += page.get_text()
+                pdf_doc.close()
+                yield f"file_{i}.txt", text.encode('utf-8')
+            else:
+                yield f"file_{i}.txt", path
+
+
+def media_entries(inputs, target_format, work_dir, progress=_no_progress, options=None):
+    options = options or {}
+    threads = options.get('ffmpeg_threads') or options.get('render_workers', 0)
+    for i, (path, name) in enumerate(inputs):
+        progress(i / len(inputs), name)
+        out_path = os.path.join(work_dir, f"file_{i}.{target_format}")
+        try:
+            media_transcode.transcode(
+                path, out_path, target_format, threads=threads,
+                preset=options.get('ffmpeg_preset', media_transcode.DEFAULT_PRESET),
+                progress=lambda fraction, message=None: progress((i + fraction) / len(inputs), name))
+            yield f"file_{i}.{target_format}", out_path
+        finally:
+            _remove(out_path)
+
+
+def entries(inputs, target_format, work_dir, progress=_no_progress, options=None):
+    """ZIP entries `(name, bytes or path)` for a non-PDF target."""
+    if target_format in ['png', 'jpg', 'webp']:
+        return image_entries(inputs, target_format, progress, options)
+    if target_format in ['docx', 'txt']:
+        return document_entries(inputs, target_format, work_dir, progress)
+    return media_entries(inputs, target_format, work_dir, progress, options)
+
+
+# ── Entry point ─────────────────────────────────────────────────────────
+def convert(inputs, target_format, out_dir, progress=_no_progress, options=None):
+    """Convert `inputs` and write the result into `out_dir`. Returns its path."""
+    if target_format not in OUTPUTS:
+        raise ValueError(f"Unbekanntes Zielformat: {target_format}")
+    out_path = os.path.join(out_dir, OUTPUTS[target_format][0])
+
+    if target_format == 'pdf':
+        data = pdf_document(inputs, progress)
+        with open(out_path, 'wb') as f:
+            f.write(data)
+    else:
+        with open(out_path, 'wb') as f:
+            for chunk in zip_stream.stream(entries(inputs, target_format, out_dir, progress, options)):
+                f.write(chunk)
+    progress(1.0)
+    return out_path
@@ -0,0 +1,192 @@
+"""
+Post-upload scan pipeline for file sharing.
+
+Uploads are answered as soon as the bytes are on disk. The new share is
+stored with `scan_status = 'pending'` and handed to `ScanQueue`, which runs
+the scanners in a small thread pool off the request path. public_server.py
+only serves shares whose status is 'clean'.
+
+Scanners are plain functions `scanner(path, filename) -> (status, message)`
+returning 'clean', 'blocked' or 'error'; the first non-clean result wins:
+
+- `builtin_scan`: extension policy (SHARE_BLOCKED_EXTENSIONS) and magic
+  bytes of executables, also for the member names of ZIP archives
+- `command_scan`: runs SHARE_SCAN_COMMAND (e.g. `clamdscan --no-summary
+  {path}`). Exit code 0 means clean, 1 means infected, anything else is an
+  error. Only active when the variable is set
+
+Blocked shares give up their blob right away (the file is deleted unless
+another share has the same content); the share row stays so the owner sees
+why. Shares stuck in 'pending' (e.g. the worker was restarted)
+or in 'error' are picked up again by the `share-scan` job, at most
+SHARE_SCAN_ATTEMPTS times. After that they end as 'failed' and stay
+unavailable instead of running a broken scanner every 10 minutes forever.
+"""
+
+import os
+import shlex
+import subprocess
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, bindparam, text
+
+import blob_store
+
+DEFAULT_BLOCKED_EXTENSIONS = ('.exe', '.com', '.bat', '.cmd', '.scr', '.pif', '.msi', '.vbs', '.vbe', '.js',
+                              '.jse', '.wsf', '.wsh', '.ps1', '.hta', '.cpl', '.jar', '.lnk', '.reg', '.dll')
+
+# Leading bytes of executable formats, blocked whatever the extension says
+EXECUTABLE_MAGIC = [
+    (b'MZ', 'Windows-Programm'),
+    (b'\x7fELF', 'Linux-Programm'),
+    (b'\xcf\xfa\xed\xfe', 'macOS-Programm'),
+    (b'\xce\xfa\xed\xfe', 'macOS-Programm'),
+]
+
+STALE_AFTER = timedelta(minutes=10)
+MAX_ATTEMPTS = int(os.environ.get('SHARE_SCAN_ATTEMPTS', 5))
+
+_STALE = "(scan_status = 'error' OR (scan_status = 'pending' AND created_at < :cutoff))"
+
+
+def blocked_extensions():
+    raw = os.environ.get('SHARE_BLOCKED_EXTENSIONS')
+    if raw is None:
+        return DEFAULT_BLOCKED_EXTENSIONS
+    return tuple('.' + e.strip().lower().lstrip('.') for e in raw.split(',') if e.strip())
+
+
+def builtin_scan(path, filename):
+    blocked = blocked_extensions()
+    if os.path.splitext(filename)[1].lower() in blocked:
+        return 'blocked', 'Dateityp nicht erlaubt'
+
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    for magic, label in EXECUTABLE_MAGIC:
+        if head.startswith(magic):
+            return 'blocked', f'{label} nicht erlaubt'
+
+    if head.startswith(b'PK') and zipfile.is_zipfile(path):
+        # Only the central directory is read, not the members
+        with zipfile.ZipFile(path) as zf:
+            for name in zf.namelist():
+                if os.path.splitext(name)[1].lower() in blocked:
+                    return 'blocked', f'Archiv enthält {os.path.basename(name)}'
+    return 'clean', None
+
+
+def command_scan(path, filename):
+    command = os.environ.get('SHARE_SCAN_COMMAND', '').strip()
+    if not command:
+        return 'clean', None
+
+    args = shlex.split(command)
+    if '{path}' in args:
+        args = [path if a == '{path}' else a for a in args]
+    else:
+        args.append(path)
+    try:
+        result = subprocess.run(args, capture_output=True, text=True,
+                                timeout=int(os.environ.get('SHARE_SCAN_TIMEOUT', 300)))
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return 'error', f'Scanner nicht ausführbar: {e}'[:255]
+
+    output = (result.stdout or result.stderr or '').strip().splitlines()
+    if result.returncode == 0:
+        return 'clean', None
+    if result.returncode == 1:
+        return 'blocked', (output[-1] if output else 'Schadsoftware gefunden')[:255]
+    return 'error', (output[-1] if output else f'Scanner-Fehler ({result.returncode})')[:255]
+
+
+SCANNERS = [builtin_scan, command_scan]
+
+
+def scan_file(path, filename):
+    for scanner in SCANNERS:
+        status, message = scanner(path, filename)
+        if status != 'clean':
+            return status, message
+    return 'clean', None
+
+
+class ScanQueue:
+    def __init__(self, app, db, workers=2):
+        self.app = app
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='share-scan')
+
+    def submit(self, share_id):
+        """Scan a share in the background (call after commit)."""
+        return self._executor.submit(self._run, share_id)
+
+    def _run(self, share_id):
+        try:
+            return self.scan(share_id)
+        except Exception as e:
+            print(f"[Scan] Scan of {share_id} failed: {e}")
+
+    def scan(self, share_id):
+        with self.app.app_context():
+            session = self.db.session
+            row = session.execute(text('SELECT filename, filepath, blob_sha256 FROM shared_file WHERE id = :id'),
+                                  {'id': share_id}).first()
+            if not row:
+                return None
+            filename, filepath, sha256 = row
+            # Do not hold a read transaction open for the length of the scan
+            session.rollback()
+            try:
+                status, message = scan_file(filepath, filename)
+            except OSError as e:
+                status, message = 'error', str(e)[:255]
+
+            if status == 'blocked':
+                # Another share may hold the same content under an allowed name.
+                # The row keeps no path, so deleting it later releases nothing.
+                # The scan took a while: release only if the share still holds
+                # the reference, it may have been deleted in the meantime
+                same_blob = 'blob_sha256 = :sha' if sha256 else 'blob_sha256 IS NULL'
+                detached = session.execute(
+                    text("UPDATE shared_file SET filepath = '', blob_sha256 = NULL "
+                         f"WHERE id = :id AND filepath = :path AND {same_blob}"),
+                    {'id': share_id, 'path': filepath, 'sha': sha256}).rowcount
+                if detached == 1:
+                    blob_store.release(session, sha256, filepath)
+            session.execute(text('UPDATE shared_file SET scan_status = :status, scan_message = :message '
+                                 'WHERE id = :id'),
+                            {'id': share_id, 'status': status, 'message': message})
+            session.commit()
+            return status
+
+    def resubmit_stale(self):
+        """
+        Requeue shares stuck in 'pending' or failed with 'error', counting an
+        attempt each time. Shares out of attempts become 'failed'. Returns
+        the number requeued.
+        """
+        cutoff = bindparam('cutoff', type_=DateTime)
+        params = {'cutoff': datetime.now() - STALE_AFTER, 'max': MAX_ATTEMPTS}
+        with self.app.app_context():
+            session = self.db.session
+            given_up = session.execute(
+                text("UPDATE shared_file SET scan_status = 'failed', "
+                     "scan_message = COALESCE(scan_message, 'Prüfung wiederholt fehlgeschlagen') "
+                     f"WHERE {_STALE} AND COALESCE(scan_attempts, 0) >= :max").bindparams(cutoff),
+                params).rowcount
+            if given_up:
+                print(f"[Scan] Gave up on {given_up} share(s) after {MAX_ATTEMPTS} attempts.")
+            rows = session.execute(text(f"SELECT id FROM shared_file WHERE {_STALE}").bindparams(cutoff),
+                                   params).all()
+            if rows:
+                session.execute(
+                    text('UPDATE shared_file SET scan_attempts = COALESCE(scan_attempts, 0) + 1 WHERE id IN :ids')
+                    .bindparams(bindparam('ids', expanding=True)),
+                    {'ids': [share_id for (share_id,) in rows]})
+            session.commit()
+        for (share_id,) in rows:
+            self.submit(share_id)
+        return len(rows)
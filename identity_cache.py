@@ -0,0 +1,99 @@
+"""
+Per-process identity cache for the Cloudflare Access auth hook.
+
+`handle_cloudflare_auth` runs before every request, including the 3-second
+poll and word cloud refreshes. Instead of loading the `User` row on every
+request, the hook and the Flask-Login user loader resolve identities from
+this cache, keyed by the `Cf-Access-Authenticated-User-Email` header and by
+user id. Entries expire after `ttl` seconds (AUTH_CACHE_TTL).
+
+`invalidate()` drops the entry locally and bumps the `identities_version`
+setting, like `SlugIndex.changed()` does for shortlinks. Every lookup
+compares that version through the cached config store and empties the
+cache when another worker changed it, so a deleted user loses access in
+every process within CONFIG_REFRESH_SECONDS, not after the TTL.
+
+The cached objects are plain snapshots (id, email, username, is_admin), not
+ORM instances, so they can be shared safely between request threads.
+"""
+
+import threading
+import time
+import uuid
+
+from flask_login import UserMixin
+
+VERSION_KEY = 'identities_version'
+
+
+class CachedIdentity(UserMixin):
+    def __init__(self, user):
+        self.id = user.id
+        self.email = user.email
+        self.username = user.username
+        self.is_admin = bool(user.is_admin)
+
+    def __repr__(self):
+        return f"<CachedIdentity {self.id} {self.email}>"
+
+
+class IdentityCache:
+    def __init__(self, config, ttl=300):
+        self.config = config
+        self.ttl = ttl
+        self._by_email = {}
+        self._by_id = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        # Needs an app context; the config store asks the DB at most every few seconds
+        version = self.config.get(VERSION_KEY)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._by_email.clear()
+                    self._by_id.clear()
+                    self._version = version
+
+    def _fresh(self, entry):
+        if entry is None:
+            return None
+        identity, expires = entry
+        if time.monotonic() > expires:
+            return None
+        return identity
+
+    def get_by_email(self, email):
+        self._check_version()
+        return self._fresh(self._by_email.get(email))
+
+    def get_by_id(self, user_id):
+        self._check_version()
+        return self._fresh(self._by_id.get(user_id))
+
+    def put(self, user):
+        self._check_version()
+        identity = CachedIdentity(user)
+        entry = (identity, time.monotonic() + self.ttl)
+        with self._lock:
+            self._by_email[identity.email] = entry
+            self._by_id[identity.id] = entry
+        return identity
+
+    def invalidate(self, user_id=None, email=None):
+        """Drop a user here and in every other process. Call after commit."""
+        self.config.set(VERSION_KEY, uuid.uuid4().hex)
+        with self._lock:
+            entry = self._by_id.pop(user_id, None) if user_id is not None else None
+            if entry:
+                self._by_email.pop(entry[0].email, None)
+            if email is not None:
+                entry = self._by_email.pop(email, None)
+                if entry:
+                    self._by_id.pop(entry[0].id, None)
+
+    def clear(self):
+        with self._lock:
+            self._by_email.clear()
+            self._by_id.clear()
@@ -0,0 +1,219 @@
+"""
+Write-coalescing ingest queue for poll votes and word cloud submissions.
+
+When a presenter shows a QR code, hundreds of people vote within seconds.
+Committing one transaction per request makes every request wait for
+SQLite's single writer lock, and some of them fail with "database is
+locked". Instead, `api_poll_vote` and `api_word_cloud_submit` validate the
+input synchronously, hand the row to this queue and answer right away.
+
+A flush thread writes everything queued every `flush_seconds`
+(INGEST_FLUSH_SECONDS) in one transaction: multi-row inserts for
+`poll_vote` and `word_cloud_entry`, one counter update per touched option
+or word and one version bump per touched poll/word cloud. Afterwards
+`notify` is called for every touched live channel (see live.py).
+
+If more than `max_pending` rows are queued, the request that adds the next
+row flushes inline, so a stalled flush thread slows senders down instead of
+growing the queue without bound. That flush never raises into the request:
+its row is queued either way. Pending rows are flushed at interpreter exit
+as well.
+
+If a batch fails, its rows are written one at a time so a single bad row
+cannot hold back the others. A row that fails MAX_ATTEMPTS times is dropped
+and logged. When several rows in a row fail, the database itself is the
+problem (e.g. locked): the remaining rows go back to the queue as they are.
+"""
+
+import atexit
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, text
+
+import word_clouds
+
+MAX_ATTEMPTS = 3
+# Consecutive single-row failures after which the rest of a batch is requeued untried
+OUTAGE_AFTER = 3
+
+_INSERT_VOTES = text(
+    'INSERT INTO poll_vote (poll_option_id, voter_name, created_at) '
+    'SELECT :option_id, :voter_name, :created_at WHERE EXISTS (SELECT 1 FROM poll_option WHERE id = :option_id)'
+).bindparams(bindparam('created_at', type_=DateTime))
+
+_INSERT_WORDS = text(
+    'INSERT INTO word_cloud_entry (word_cloud_id, word, voter_name, created_at) '
+    'SELECT :cloud_id, :word, :voter_name, :created_at WHERE EXISTS (SELECT 1 FROM word_cloud WHERE id = :cloud_id)'
+).bindparams(bindparam('created_at', type_=DateTime))
+
+
+class IngestQueue:
+    def __init__(self, app, db, flush_seconds=0.25, max_pending=5000, notify=None):
+        self.app = app
+        self.db = db
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.notify = notify
+        self._votes = []
+        self._words = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+        # Stats
+        self._latencies = deque(maxlen=100)
+        self._oldest = None
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped_rows = 0
+        self.last_error = None
+
+    def add_vote(self, poll_id, slug, option_id, voter_name):
+        self._add(self._votes, {'poll_id': poll_id, 'slug': slug, 'option_id': option_id,
+                                'voter_name': voter_name, 'created_at': datetime.now()})
+
+    def add_word(self, cloud_id, slug, word, voter_name):
+        self._add(self._words, {'cloud_id': cloud_id, 'slug': slug, 'word': word,
+                                'voter_name': voter_name, 'created_at': datetime.now()})
+
+    def _add(self, target, row):
+        with self._lock:
+            target.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            depth = len(self._votes) + len(self._words)
+        if self._thread is None:
+            self._start()
+        if depth >= self.max_pending:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Ingest] Inline flush failed: {e}")
+
+    def depth(self):
+        return len(self._votes) + len(self._words)
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+        oldest = self._oldest
+        return {
+            'depth': self.depth(),
+            'oldest_pending_ms': round((time.monotonic() - oldest) * 1000) if oldest else 0,
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+            'failures': self.failures,
+            'dropped_rows': self.dropped_rows,
+            'last_error': self.last_error,
+            'flush_ms_avg': round(sum(latencies) / len(latencies), 1) if latencies else 0,
+            'flush_ms_max': round(latencies[-1], 1) if latencies else 0,
+            'flush_ms_p95': round(latencies[int(len(latencies) * 0.95) - 1], 1) if len(latencies) >= 20 else None,
+        }
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._flush_loop, name='ingest-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            if not self._votes and not self._words:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Ingest] Flush failed: {e}")
+
+    def flush(self):
+        """Persist all queued rows, in one transaction if possible. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                votes, words = self._votes, self._words
+                self._votes, self._words = [], []
+                oldest, self._oldest = self._oldest, None
+            if not votes and not words:
+                return 0
+
+            started = time.perf_counter()
+            with self.app.app_context():
+                session = self.db.session
+                try:
+                    self._write(session, votes, words)
+                    written_votes, written_words = votes, words
+                except Exception as e:
+                    session.rollback()
+                    self.failures += 1
+                    self.last_error = str(e)
+                    print(f"[Ingest] Batch of {len(votes) + len(words)} rows failed, writing them one by one: {e}")
+                    written_votes, written_words = self._write_each(session, votes, words, oldest)
+
+            self._latencies.append((time.perf_counter() - started) * 1000)
+            self.flushes += 1
+            self.flushed_rows += len(written_votes) + len(written_words)
+
+            if self.notify:
+                for key in {('poll', v['slug']) for v in written_votes} | \
+                           {('wordcloud', w['slug']) for w in written_words}:
+                    self.notify(key)
+            return len(written_votes) + len(written_words)
+
+    def _write(self, session, votes, words):
+        if votes:
+            session.execute(_INSERT_VOTES, votes)
+            per_option = Counter(v['option_id'] for v in votes)
+            session.execute(
+                text('UPDATE poll_option SET vote_count = COALESCE(vote_count, 0) + :n WHERE id = :id'),
+                [{'id': option_id, 'n': n} for option_id, n in per_option.items()])
+            session.execute(
+                text('UPDATE poll SET results_version = COALESCE(results_version, 0) + 1 WHERE id = :id'),
+                [{'id': poll_id} for poll_id in {v['poll_id'] for v in votes}])
+        if words:
+            session.execute(_INSERT_WORDS, words)
+            word_clouds.record_words(session, Counter((w['cloud_id'], w['word']) for w in words))
+            session.execute(
+                text('UPDATE word_cloud SET version = COALESCE(version, 0) + 1 WHERE id = :id'),
+                [{'id': cloud_id} for cloud_id in {w['cloud_id'] for w in words}])
+        session.commit()
+
+    def _write_each(self, session, votes, words, oldest):
+        """Write rows in their own transactions after a failed batch. Returns the rows written."""
+        written = {'vote': [], 'word': []}
+        retry = {'vote': [], 'word': []}
+        consecutive_failures = 0
+        rows = [('vote', v) for v in votes] + [('word', w) for w in words]
+        for i, (kind, row) in enumerate(rows):
+            if consecutive_failures >= OUTAGE_AFTER:
+                # Not the rows, the database: keep the rest for the next flush
+                for rest_kind, rest in rows[i:]:
+                    retry[rest_kind].append(rest)
+                break
+            try:
+                self._write(session, [row] if kind == 'vote' else [], [row] if kind == 'word' else [])
+                written[kind].append(row)
+                consecutive_failures = 0
+            except Exception as e:
+                session.rollback()
+                consecutive_failures += 1
+                row['attempts'] = row.get('attempts', 0) + 1
+                if row['attempts'] < MAX_ATTEMPTS:
+                    retry[kind].append(row)
+                else:
+                    self.dropped_rows += 1
+                    self.last_error = str(e)
+                    print(f"[Ingest] Dropped {kind} after {MAX_ATTEMPTS} attempts: {row} ({e})")
+
+        if retry['vote'] or retry['word']:
+            # Behind rows queued in the meantime, so they do not block them
+            with self._lock:
+                self._votes.extend(retry['vote'])
+                self._words.extend(retry['word'])
+                if self._oldest is None:
+                    self._oldest = oldest
+        return written['vote'], written['word']
@@ -0,0 +1,196 @@
+"""
+Lazy dependency registry for L8teTools.
+
+Heavy tool backends (yt-dlp, OpenCV, spaCy, PyMuPDF, ...) are only
+needed by a handful of routes, but importing them at module level makes every
+worker pay seconds of CPU time and hundreds of MB before it can serve the
+dashboard. Every backend is registered here with a loader and is imported on
+first use instead.
+
+USAGE:
+- deps.load('fitz')   -> module, raises if the backend is not installed
+- deps.get('pisa')    -> module or None (for optional backends)
+- DEPS_WARMUP=fitz,yt_dlp (or "all") preloads backends at startup
+- deps.report()       -> import cost of every backend loaded so far
+"""
+
+import os
+import threading
+import time
+
+
+class LazyRegistry:
+    def __init__(self):
+        self._loaders = {}
+        self._modules = {}
+        self._errors = {}
+        self._timings = {}
+        self._lock = threading.RLock()
+
+    def register(self, name):
+        """Decorator registering a loader function under the given name."""
+        def decorator(func):
+            self._loaders[name] = func
+            return func
+        return decorator
+
+    def names(self):
+        return list(self._loaders)
+
+    def load(self, name):
+        """Return the backend, importing it on first use. Raises if unavailable."""
+        if name in self._modules:
+            return self._modules[name]
+        if name in self._errors:
+            raise self._errors[name]
+
+        with self._lock:
+            if name in self._modules:
+                return self._modules[name]
+            if name in self._errors:
+                raise self._errors[name]
+
+            loader = self._loaders[name]
+            start = time.perf_counter()
+            try:
+                module = loader()
+            except Exception as e:
+                self._timings[name] = time.perf_counter() - start
+                self._errors[name] = e
+                raise
+            self._timings[name] = time.perf_counter() - start
+            self._modules[name] = module
+            return module
+
+    def get(self, name):
+        """Return the backend or None if it cannot be imported."""
+        try:
+            return self.load(name)
+        except Exception:
+            return None
+
+    def warm_up(self, names=None):
+        """Preload backends. Defaults to the DEPS_WARMUP environment variable."""
+        if names is None:
+            raw = os.environ.get('DEPS_WARMUP', '').strip()
+            if not raw:
+                return
+            names = self.names() if raw == 'all' else [n.strip() for n in raw.split(',') if n.strip()]
+
+        for name in names:
+            if name not in self._loaders:
+                print(f"[Deps] Unknown backend in warm-up list: {name}")
+                continue
+            self.get(name)
+
+    def report(self):
+        """List of dicts describing every registered backend, slowest first."""
+        rows = []
+        for name in self._loaders:
+            rows.append({
+                'name': name,
+                'loaded': name in self._modules,
+                'error': str(self._errors[name]) if name in self._errors else None,
+                'seconds': self._timings.get(name),
+            })
+        rows.sort(key=lambda r: r['seconds'] or 0, reverse=True)
+        return rows
+
+    def print_report(self, title='[Deps] Import cost'):
+        rows = [r for r in self.report() if r['seconds'] is not None]
+        if not rows:
+            return
+        print(f"{title}:")
+        for r in rows:
+            status = 'ok' if r['loaded'] else f"failed ({r['error']})"
+            print(f"  {r['name']:<16} {r['seconds'] * 1000:8.1f} ms  {status}")
+
+
+deps = LazyRegistry()
+
+
+# ── Registered backends ─────────────────────────────────────────────────
+@deps.register('yt_dlp')
+def _load_yt_dlp():
+    import yt_dlp
+    return yt_dlp
+
+
+@deps.register('imageio_ffmpeg')
+def _load_imageio_ffmpeg():
+    import imageio_ffmpeg
+    return imageio_ffmpeg
+
+
+@deps.register('cv2')
+def _load_cv2():
+    import cv2
+    return cv2
+
+
+@deps.register('numpy')
+def _load_numpy():
+    import numpy
+    return numpy
+
+
+@deps.register('fitz')
+def _load_fitz():
+    import fitz  # PyMuPDF
+    return fitz
+
+
+@deps.register('img2pdf')
+def _load_img2pdf():
+    import img2pdf
+    return img2pdf
+
+
+@deps.register('pdf2docx')
+def _load_pdf2docx():
+    from pdf2docx import Converter
+    return Converter
+
+
+@deps.register('cairosvg')
+def _load_cairosvg():
+    import cairosvg
+    return cairosvg
+
+
+@deps.register('pisa')
+def _load_pisa():
+    from xhtml2pdf import pisa
+    return pisa
+
+
+@deps.register('docx')
+def _load_docx():
+    import docx
+    return docx
+
+
+@deps.register('whois')
+def _load_whois():
+    import whois
+    return whois
+
+
+@deps.register('holidays')
+def _load_holidays():
+    import holidays
+    return holidays
+
+
+@deps.register('heif')
+def _load_heif():
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    return register_heif_opener
+
+
+@deps.register('spacy_de')
+def _load_spacy_de():
+    import spacy
+    return spacy.load("de_core_news_sm")
+
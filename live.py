@@ -0,0 +1,157 @@
+"""
+Server-Sent Events hub for live poll and word cloud results.
+
+Viewers used to poll the results endpoints every 3 seconds each. Now every
+viewer opens one event stream and the hub pushes a new snapshot only when
+the data changed:
+
+- Each channel (e.g. ('poll', slug)) has a cheap `version_fn` (one
+  single-row SELECT) and a `snapshot_fn` (the real aggregation)
+- One watcher thread per process checks the version of every channel that
+  has subscribers every `poll_interval` seconds (LIVE_POLL_INTERVAL), or
+  immediately after `notify()` for writes made by this process
+- When the version changed, the snapshot is computed once, encoded once and
+  fanned out to all subscribers of that channel
+- When the poll or word cloud is deleted, every stream ends with a
+  `deleted` event. The pages stop listening then; a plain disconnect would
+  make EventSource reconnect to a 404 every few seconds
+
+Streams hold a server thread each, so the app must run with a threaded
+server (the built-in one or gunicorn --worker-class gthread).
+"""
+
+import json
+import queue
+import threading
+import time
+
+HEARTBEAT_SECONDS = 15
+DELETED = 'event: deleted\ndata: {}\n\n'
+
+
+class _Channel:
+    def __init__(self, version_fn, snapshot_fn):
+        self.version_fn = version_fn
+        self.snapshot_fn = snapshot_fn
+        self.subscribers = set()
+        self.version = None
+        self.message = None
+        self.dirty = True
+        self.checked_at = 0
+
+
+class LiveHub:
+    def __init__(self, app, poll_interval=1.0, max_subscribers=500):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _count(self):
+        # Caller holds self._lock: streams subscribe and leave concurrently
+        return sum(len(c.subscribers) for c in self._channels.values())
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count()
+
+    def notify(self, key):
+        """Mark a channel as changed (call after commit)."""
+        channel = self._channels.get(key)
+        if channel:
+            channel.dirty = True
+            self._wake.set()
+
+    def subscribe(self, key, version_fn, snapshot_fn):
+        """Return an SSE generator for the channel, or None if the hub is full."""
+        q = queue.Queue(maxsize=8)
+        with self._lock:
+            if self._count() >= self.max_subscribers:
+                return None
+            channel = self._channels.get(key)
+            if channel is None:
+                channel = self._channels[key] = _Channel(version_fn, snapshot_fn)
+            channel.subscribers.add(q)
+            if channel.message is not None:
+                q.put_nowait(channel.message)
+            else:
+                channel.dirty = True
+        self._ensure_thread()
+        self._wake.set()
+        return self._stream(key, channel, q)
+
+    def _stream(self, key, channel, q):
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    message = q.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Keeps proxies from closing the connection, detects gone clients
+                    yield ': ping\n\n'
+                    continue
+                if message is None:
+                    yield DELETED
+                    return
+                yield message
+        finally:
+            with self._lock:
+                channel.subscribers.discard(q)
+                if not channel.subscribers and self._channels.get(key) is channel:
+                    del self._channels[key]
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, name='live-hub', daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            with self._lock:
+                channels = list(self._channels.items())
+            now = time.monotonic()
+            for key, channel in channels:
+                if not channel.dirty and now - channel.checked_at < self.poll_interval:
+                    continue
+                try:
+                    self._refresh(key, channel)
+                except Exception as e:
+                    print(f"[Live] Refresh of {key} failed: {e}")
+
+    def _refresh(self, key, channel):
+        channel.dirty = False
+        channel.checked_at = time.monotonic()
+        with self.app.app_context():
+            version = channel.version_fn()
+            if version is None:
+                # Poll or word cloud was deleted
+                self._broadcast(channel, None)
+                return
+            if version == channel.version and channel.message is not None:
+                return
+            payload = channel.snapshot_fn()
+
+        channel.version = version
+        channel.message = f"data: {json.dumps(payload)}\n\n"
+        self._broadcast(channel, channel.message)
+
+    def _broadcast(self, channel, message):
+        for q in list(channel.subscribers):
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Slow client: drop its backlog, the newest snapshot is all it needs
+                try:
+                    while True:
+                        q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(message)
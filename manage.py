@@ -1,7 +1,16 @@
+import os
+import subprocess
 import sys
-from app import app, db, User
+import tempfile
+import time
+
+# One-off commands must never become the scheduler leader
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+
 
 def create_user(username, password):
+    from app import app, db, User
+
     with app.app_context():
         if User.query.filter_by(username=username).first():
             print(f"Fehler: Benutzer '{username}' existiert bereits.")
@@ -13,8 +22,437 @@ def create_user(username, password):
         db.session.commit()
         print(f"Benutzer '{username}' erfolgreich erstellt.")
 
+
+def migrate():
+    """Apply pending schema migrations (the app does this on boot unless AUTO_MIGRATE=false)."""
+    os.environ['AUTO_MIGRATE'] = 'false'
+    import migrations
+    from app import app, db
+
+    with app.app_context():
+        version, pending = migrations.status(db)
+        print(f"Schema-Version: {version} (aktuell: {migrations.LATEST_VERSION})")
+        if not pending:
+            print("Datenbank ist aktuell.")
+            return
+        lock_path = os.path.join(app.instance_path, 'migrate.lock')
+        migrations.upgrade(db, lock_path=lock_path, verbose=True)
+        print(f"{len(pending)} Migration(en) angewendet.")
+
+
+def use_scratch_database():
+    """Point the app at a throw-away SQLite file (benchmarks must not touch real data)."""
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_'), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    return path
+
+
+def bench_redirects(links=1000, hits=5000):
+    """Measure shortlink redirect throughput of the in-memory fast path."""
+    use_scratch_database()
+    from app import app, db, User, Shortlink, slug_index
+
+    email = 'bench@local.host'
+    with app.app_context():
+        user = User(email=email, username=email, password_hash='cloudflare_auth')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([Shortlink(slug=f'link{i}', target_url=f'https://example.com/{i}', user_id=user.id)
+                            for i in range(links)])
+        db.session.commit()
+        slug_index.changed()
+
+    client = app.test_client()
+    start = time.perf_counter()
+    for i in range(hits):
+        response = client.get(f'/link{i % links}')
+        assert response.status_code == 302
+    fast = time.perf_counter() - start
+
+    # Previous behaviour: user lookup in the auth hook plus one slug query per hit
+    with app.app_context():
+        start = time.perf_counter()
+        for i in range(hits):
+            User.query.filter_by(email=email).first()
+            Shortlink.query.filter_by(slug=f'link{i % links}').first()
+            db.session.rollback()
+        queries = time.perf_counter() - start
+
+    print(f"Redirects:   {hits} requests on {links} links")
+    print(f"Fast path:   {hits / fast:10.0f} req/s  ({fast / hits * 1e6:.0f} us per redirect incl. WSGI)")
+    print(f"DB lookups:  {hits / queries:10.0f} /s     ({queries / hits * 1e6:.0f} us saved per redirect)")
+
+
+def bench_polls(votes=10000, refreshes=200):
+    """Compare poll result aggregation: lazy-loaded PollVote rows vs. maintained counters."""
+    use_scratch_database()
+    import random
+    from app import app, db, User, Poll, PollOption, PollVote
+
+    with app.app_context():
+        user = User(email='bench@local.host', username='bench@local.host', password_hash='cloudflare_auth')
+        db.session.add(user)
+        db.session.flush()
+        poll = Poll(title='Bench', question='?', user_id=user.id, slug='benchpol')
+        db.session.add(poll)
+        db.session.flush()
+        options = [PollOption(poll_id=poll.id, text=f'Option {i}') for i in range(6)]
+        db.session.add_all(options)
+        db.session.flush()
+        counts = {o.id: 0 for o in options}
+        rows = []
+        for i in range(votes):
+            option_id = random.choice(options).id
+            counts[option_id] += 1
+            rows.append({'poll_option_id': option_id, 'voter_name': f'voter{i}'})
+        db.session.execute(PollVote.__table__.insert(), rows)
+        for o in options:
+            o.vote_count = counts[o.id]
+        db.session.commit()
+
+        # Previous behaviour: len(opt.votes) hydrates every PollVote row
+        start = time.perf_counter()
+        for _ in range(refreshes):
+            p = Poll.query.filter_by(slug='benchpol').first()
+            [len(opt.votes) for opt in p.options]
+            db.session.rollback()
+        legacy = (time.perf_counter() - start) / refreshes
+
+    # Viewers are signed in through Cloudflare Access; without the header every request is a 401
+    client = app.test_client()
+    headers = {'Cf-Access-Authenticated-User-Email': 'bench@local.host'}
+    response = client.get('/api/poll/benchpol/results', headers=headers)
+    assert response.status_code == 200, response.status_code
+    start = time.perf_counter()
+    for _ in range(refreshes):
+        response = client.get('/api/poll/benchpol/results', headers=headers)
+        assert response.status_code == 200
+    cached = (time.perf_counter() - start) / refreshes
+
+    from polls import compute_results
+    with app.app_context():
+        p = Poll.query.filter_by(slug='benchpol').first()
+        start = time.perf_counter()
+        for _ in range(refreshes):
+            compute_results(db.session, p)
+        counters = (time.perf_counter() - start) / refreshes
+
+    print(f"Poll results with {votes} votes, {refreshes} refreshes")
+    print(f"Lazy-loaded votes:   {legacy * 1000:8.2f} ms per refresh")
+    print(f"Option counters:     {counters * 1000:8.2f} ms per refresh")
+    print(f"Cached (HTTP):       {cached * 1000:8.2f} ms per refresh incl. WSGI")
+
+
+def bench_downloads(parallel=50, size_kb=1024):
+    """Fire parallel downloads at a burn-after-download share; exactly one may succeed."""
+    use_scratch_database()
+    import logging
+    import threading
+    import urllib.error
+    import urllib.request
+    import uuid
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import make_server
+    from app import app, db, User, SharedFile
+    import public_server
+
+    token = uuid.uuid4().hex
+    upload_folder = public_server.app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    path = os.path.join(upload_folder, f"{token}_bench.bin")
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size_kb * 1024))
+    with app.app_context():
+        user = User(email='bench@local.host', username='bench@local.host', password_hash='cloudflare_auth')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(SharedFile(id=token, filename='bench.bin', filepath=path, user_id=user.id,
+                                  expiration_mode='download', max_downloads=1, scan_status='clean'))
+        db.session.commit()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, public_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/s/{token}/download"
+    barrier = threading.Barrier(parallel)
+
+    def download(i):
+        # Every request is a different client, so none of them resumes another
+        request = urllib.request.Request(url, headers={'User-Agent': f'bench-{i}'})
+        barrier.wait()
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        results = list(pool.map(download, range(parallel)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    if os.path.exists(path):
+        os.remove(path)
+
+    with app.app_context():
+        share = db.session.get(SharedFile, token)
+        count = share.download_count if share else None
+    served = [length for status, length in results if status == 200]
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"Burn link, {parallel} parallel downloads in {elapsed * 1000:.0f} ms")
+    print(f"Status codes:    {dict(sorted(statuses.items()))}")
+    print(f"download_count:  {count}")
+    ok = len(served) == 1 and served[0] == size_kb * 1024 and count == 1
+    print("OK: genau ein Download ausgeliefert" if ok else "FEHLER: Download-Limit nicht eingehalten")
+    sys.exit(0 if ok else 1)
+
+
+def bench_img2pdf(count=100, width=2000, height=1500):
+    """Convert synthetic phone photos to one PDF: decode/re-encode per image vs. img2pdf fast path."""
+    import io
+    import shutil
+    import tempfile
+    import numpy as np
+    from PIL import Image
+    import converter
+    from lazy_deps import deps
+
+    work_dir = tempfile.mkdtemp(prefix='l8te_bench_')
+    try:
+        # Gradient plus sensor noise compresses roughly like a real photo
+        rng = np.random.default_rng(0)
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        inputs = []
+        for i in range(count):
+            pixels = gradient * np.linspace(0.3, 1, height, dtype=np.float32)[:, None, None]
+            pixels = pixels + rng.normal(0, 12, (height, width, 3)) + (i * 7 % 60)
+            path = os.path.join(work_dir, f'IMG_{i:04d}.jpg')
+            Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, quality=90)
+            inputs.append((path, f'IMG_{i:04d}.jpg'))
+        input_bytes = sum(os.path.getsize(path) for path, _ in inputs)
+
+        # Previous behaviour: decode, re-encode as JPEG, one PDF per image, merge with fitz
+        img2pdf = deps.load('img2pdf')
+        fitz = deps.load('fitz')
+        start = time.perf_counter()
+        doc = fitz.open()
+        for path, _ in inputs:
+            img = Image.open(path)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG')
+            part = fitz.open("pdf", img2pdf.convert(buffer.getvalue()))
+            doc.insert_pdf(part)
+            part.close()
+        legacy_bytes = len(doc.tobytes())
+        doc.close()
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast_bytes = len(converter.pdf_document(inputs))
+        fast = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    mb = 1024 * 1024
+    print(f"{count} photos {width}x{height}, {input_bytes / mb:.1f} MB JPEG")
+    print(f"Re-encode + merge:  {legacy:7.2f} s  {legacy_bytes / mb:7.1f} MB PDF (generation loss)")
+    print(f"img2pdf fast path:  {fast:7.2f} s  {fast_bytes / mb:7.1f} MB PDF (JPEG data unchanged)")
+    print(f"Speedup:            {legacy / fast:7.1f}x")
+
+
+def bench_pdf_raster(pages=40, dpi=150, workers=0):
+    """Render a scanned PDF to PNG: page by page with a PIL copy vs. pdf_raster worker processes."""
+    import io
+    import shutil
+    import tempfile
+    import numpy as np
+    from PIL import Image
+    import pdf_raster
+    from lazy_deps import deps
+
+    fitz = deps.load('fitz')
+    workers = workers or os.cpu_count() or 1
+    work_dir = tempfile.mkdtemp(prefix='l8te_bench_')
+    try:
+        # A scan is one full-page image per page
+        rng = np.random.default_rng(0)
+        scan = io.BytesIO()
+        Image.fromarray(rng.integers(200, 256, (1650, 1275), dtype=np.uint8)).save(scan, format='JPEG')
+        path = os.path.join(work_dir, 'scan.pdf')
+        doc = fitz.open()
+        for _ in range(pages):
+            page = doc.new_page()
+            page.insert_image(page.rect, stream=scan.getvalue())
+        doc.save(path)
+        doc.close()
+
+        # Previous behaviour: one page after the other, pixmap copied into PIL, then encoded
+        start = time.perf_counter()
+        doc = fitz.open(path)
+        for page_num in range(len(doc)):
+            pix = doc.load_page(page_num).get_pixmap(dpi=dpi)
+            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            img.save(io.BytesIO(), format='PNG')
+        doc.close()
+        legacy = time.perf_counter() - start
+
+        timings = []
+        for n in sorted({1, workers}):
+            start = time.perf_counter()
+            for _ in pdf_raster.render(path, 'png', dpi, None, n):
+                pass
+            timings.append((n, time.perf_counter() - start))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{pages} scanned pages to PNG at {dpi} DPI ({os.cpu_count()} CPU cores)")
+    print(f"Page by page + PIL:  {legacy:7.2f} s")
+    for n, elapsed in timings:
+        print(f"pdf_raster, {n:2d} proc:  {elapsed:7.2f} s  ({legacy / elapsed:.1f}x)")
+
+
+def bench_zip_stream(count=100, size_kb=4096):
+    """Peak memory and time to first byte of a batch ZIP: BytesIO archive vs. zip_stream."""
+    import io
+    import tracemalloc
+    import zipfile
+    import zip_stream
+
+    def entries():
+        # Stand-in for converted files: incompressible, like images
+        for i in range(count):
+            yield f"file_{i}.png", os.urandom(size_kb * 1024)
+
+    # Previous behaviour: the whole archive in memory, sent when complete
+    tracemalloc.start()
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, data in entries():
+            zf.writestr(name, data)
+    body = buffer.getvalue()
+    legacy_first = time.perf_counter() - start
+    legacy_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del buffer, body
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in zip_stream.stream(entries()):
+        first = first or time.perf_counter() - start
+        size += len(chunk)
+    stream_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    mb = 1024 * 1024
+    print(f"{count} entries of {size_kb} KB, {size / mb:.0f} MB archive")
+    print(f"BytesIO + send_file:  first byte after {legacy_first * 1000:8.1f} ms, peak {legacy_peak / mb:7.1f} MB")
+    print(f"zip_stream:           first byte after {first * 1000:8.1f} ms, peak {stream_peak / mb:7.1f} MB")
+
+
+def bench_transcode(seconds=60):
+    """Convert an H.264/AAC .mov to .mp4: full re-encode (as moviepy did) vs. media_transcode's stream copy."""
+    import shutil
+    import tempfile
+    import media_transcode
+
+    ffmpeg = media_transcode.ffmpeg_exe()
+    work_dir = tempfile.mkdtemp(prefix='l8te_bench_')
+    try:
+        source = os.path.join(work_dir, 'phone.mov')
+        subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30',
+                        '-f', 'lavfi', '-i', 'sine=frequency=440', '-t', str(seconds),
+                        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac', source], check=True)
+
+        # Previous behaviour: every frame decoded and encoded again with libx264
+        info = media_transcode.probe(source)
+        start = time.perf_counter()
+        subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', source]
+                       + media_transcode.plan(info, 'mp4', copy=False)
+                       + ['-preset', media_transcode.DEFAULT_PRESET, os.path.join(work_dir, 'encoded.mp4')], check=True)
+        encoded = time.perf_counter() - start
+
+        start = time.perf_counter()
+        mode = media_transcode.transcode(source, os.path.join(work_dir, 'copied.mp4'), 'mp4')
+        copied = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{seconds} s of 720p30 H.264/AAC, .mov -> .mp4")
+    print(f"Re-encode (libx264 {media_transcode.DEFAULT_PRESET}):  {encoded:7.2f} s")
+    print(f"media_transcode ({mode}):     {copied:7.2f} s  ({encoded / copied:.0f}x)")
+
+
+def import_report(limit=20):
+    """Print the import cost of the app modules and of every lazy tool backend."""
+    # -X importtime measures every import of a fresh interpreter starting the app
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        # Children are printed before their parent: keep the direct imports of app
+        if depth == 0:
+            if name == 'app':
+                break
+            top_level = []
+        elif depth == 1:
+            top_level.append((int(parts[1]), name.strip()))
+
+    top_level.sort(reverse=True)
+    print("Startup imports (cumulative):")
+    for micros, name in top_level[:limit]:
+        print(f"  {name:<36} {micros / 1000:8.1f} ms")
+
+    from lazy_deps import deps
+    deps.warm_up(deps.names())
+    deps.print_report("Tool backends (loaded on first use)")
+
+
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
+    if len(sys.argv) == 2 and sys.argv[1] == 'migrate':
+        migrate()
+    elif len(sys.argv) == 2 and sys.argv[1] == 'imports':
+        import_report()
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'bench-polls':
+        bench_polls(*map(int, sys.argv[2:4]))
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'bench-redirects':
+        bench_redirects(*map(int, sys.argv[2:4]))
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'bench-downloads':
+        bench_downloads(*map(int, sys.argv[2:4]))
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'bench-img2pdf':
+        bench_img2pdf(*map(int, sys.argv[2:5]))
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'bench-pdf-raster':
+        bench_pdf_raster(*map(int, sys.argv[2:5]))
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'bench-zip-stream':
+        bench_zip_stream(*map(int, sys.argv[2:4]))
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'bench-transcode':
+        bench_transcode(*map(int, sys.argv[2:3]))
+    elif len(sys.argv) != 3:
         print("Verwendung: python manage.py <username> <password>")
+        print("            python manage.py migrate")
+        print("            python manage.py imports")
+        print("            python manage.py bench-redirects [links] [hits]")
+        print("            python manage.py bench-polls [votes] [refreshes]")
+        print("            python manage.py bench-downloads [parallel] [size_kb]")
+        print("            python manage.py bench-img2pdf [count] [width] [height]")
+        print("            python manage.py bench-pdf-raster [pages] [dpi] [workers]")
+        print("            python manage.py bench-zip-stream [count] [size_kb]")
+        print("            python manage.py bench-transcode [seconds]")
     else:
         create_user(sys.argv[1], sys.argv[2])
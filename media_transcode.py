@@ -0,0 +1,144 @@
+"""
+Audio/video conversion with the ffmpeg binary bundled by imageio-ffmpeg.
+
+The converter used to go through moviepy, which decodes every frame into
+NumPy arrays in Python and encodes them again, even when a .mov only needs
+to be put into an .mp4 container. `transcode()` runs ffmpeg itself:
+
+1. `probe()` reads container, duration and the codec of every stream from
+   `ffmpeg -i` (the bundled build has no ffprobe)
+2. every stream whose codec the target accepts as-is is copied, only the
+   others are re-encoded. A .mov with H.264/AAC becomes an .mp4 in the time
+   it takes to copy the file
+3. if a copy fails anyway (odd timestamps, broken headers), the whole file
+   is re-encoded once more
+
+Re-encoding uses `threads` and, for H.264, `preset`. Progress is read from
+`-progress pipe:1` (`out_time_us`) and reported as a fraction of the input
+duration.
+"""
+
+import os
+import re
+import subprocess
+import tempfile
+
+from lazy_deps import deps
+
+DEFAULT_PRESET = 'medium'
+PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+
+# target -> codecs that can be copied and the encoders used otherwise.
+# H.264 is only copied as 4:2:0, the one variant every player decodes.
+TARGETS = {
+    'mp4': {'video': ('h264',), 'audio': ('aac', 'mp3'), 'vcodec': 'libx264', 'acodec': 'aac',
+            'args': ['-movflags', '+faststart']},
+    'mov': {'video': ('h264',), 'audio': ('aac', 'mp3'), 'vcodec': 'libx264', 'acodec': 'aac', 'args': []},
+    'mp3': {'audio': ('mp3',), 'acodec': 'libmp3lame', 'args': []},
+    'wav': {'audio': ('pcm_s16le',), 'acodec': 'pcm_s16le', 'args': []},
+    'ogg': {'audio': ('vorbis', 'opus'), 'acodec': 'libvorbis', 'args': []},
+}
+COPYABLE_PIXEL_FORMATS = ('yuv420p', 'yuvj420p')
+
+_DURATION = re.compile(r'Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)')
+_STREAM = re.compile(r'Stream #\d+:\d+.*?: (Video|Audio): (\w+)([^\n]*)')
+
+
+def _no_progress(fraction, message=None):
+    pass
+
+
+def ffmpeg_exe():
+    return deps.load('imageio_ffmpeg').get_ffmpeg_exe()
+
+
+def probe(path):
+    """{'duration': seconds or None, 'video': [(codec, pixel format)], 'audio': [codec]}"""
+    result = subprocess.run([ffmpeg_exe(), '-hide_banner', '-nostdin', '-i', path],
+                            capture_output=True, text=True, errors='replace')
+    # Without an output file ffmpeg always exits with 1; the input is described on stderr
+    info = {'duration': None, 'video': [], 'audio': []}
+    match = _DURATION.search(result.stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    for kind, codec, rest in _STREAM.findall(result.stderr):
+        if kind == 'Audio':
+            info['audio'].append(codec)
+        elif 'attached pic' not in rest:
+            # Cover art of audio files is a video stream too
+            pixel_format = re.match(r'[^,]*, (\w+)', rest)
+            info['video'].append((codec, pixel_format.group(1) if pixel_format else None))
+    if not info['video'] and not info['audio']:
+        raise ValueError(f"Keine Audio- oder Videospur gefunden: {os.path.basename(path)}")
+    return info
+
+
+def plan(info, target_format, copy=True):
+    """ffmpeg codec arguments for `target_format`, copying what fits unless `copy` is False."""
+    target = TARGETS[target_format]
+    args = []
+    if 'video' in target and info['video']:
+        codec, pixel_format = info['video'][0]
+        if copy and codec in target['video'] and pixel_format in COPYABLE_PIXEL_FORMATS:
+            args += ['-c:v', 'copy']
+        else:
+            args += ['-c:v', target['vcodec'], '-pix_fmt', 'yuv420p']
+    else:
+        args += ['-vn']
+    if info['audio']:
+        args += ['-c:a', 'copy' if copy and info['audio'][0] in target['audio'] else target['acodec']]
+    return args + ['-sn', '-dn'] + target['args']
+
+
+def _run(command, duration, progress):
+    """Run ffmpeg, feeding `progress` from its -progress output. Returns (exit code, error text)."""
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=errors, text=True)
+        try:
+            for line in process.stdout:
+                key, _, value = line.strip().partition('=')
+                if key == 'out_time_us' and duration and value.isdigit():
+                    progress(min(int(value) / 1e6 / duration, 1.0))
+            process.wait()
+        except BaseException:
+            # Cancelled (or the worker is shutting down): do not leave ffmpeg running
+            process.kill()
+            process.wait()
+            raise
+        errors.seek(0)
+        return process.returncode, errors.read().decode('utf-8', errors='replace').strip()
+
+
+def transcode(path, out_path, target_format, threads=0, preset=DEFAULT_PRESET, progress=_no_progress):
+    """
+    Convert `path` into `out_path`. `progress(fraction)` is called while
+    ffmpeg runs and may raise to stop it. Returns 'copy', 'partial' or
+    'encode' depending on how much could be copied.
+    """
+    if target_format not in TARGETS:
+        raise ValueError(f"Unbekanntes Zielformat: {target_format}")
+    info = probe(path)
+    if 'video' not in TARGETS[target_format] and not info['audio']:
+        raise ValueError(f"Keine Audiospur gefunden: {os.path.basename(path)}")
+
+    base = [ffmpeg_exe(), '-hide_banner', '-nostdin', '-y', '-loglevel', 'error',
+            '-progress', 'pipe:1', '-nostats', '-i', path]
+
+    def command(args):
+        args = args + ['-threads', str(threads)]
+        if TARGETS[target_format].get('vcodec') in args:
+            args += ['-preset', preset if preset in PRESETS else DEFAULT_PRESET]
+        return base + args + [out_path]
+
+    args = plan(info, target_format)
+    returncode, error = _run(command(args), info['duration'], progress)
+    if returncode != 0 and 'copy' in args:
+        args = plan(info, target_format, copy=False)
+        returncode, error = _run(command(args), info['duration'], progress)
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg fehlgeschlagen: {error.splitlines()[-1] if error else returncode}")
+
+    copied, streams = args.count('copy'), args.count('-c:v') + args.count('-c:a')
+    return 'encode' if not copied else 'copy' if copied == streams else 'partial'
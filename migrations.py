@@ -0,0 +1,207 @@
+"""
+Versioned schema migrations for L8teTools.
+
+The database records the applied schema version in a one-row
+`schema_version` table. On boot `upgrade()` only runs a single
+`SELECT version FROM schema_version`; the ordered steps below are applied
+only when that version is behind `LATEST_VERSION`.
+
+RULES FOR NEW STEPS:
+- Append a new function with the next version number, never edit old ones
+- Steps must be idempotent: a fresh database is built by `db.create_all()`
+  in the baseline step and already has every table and column
+- New tables: create_table(db, conn, 'name'), new columns: add_column(...)
+"""
+
+from sqlalchemy import inspect, text
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, single-process dev setup
+    fcntl = None
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+
+# ── Helpers for steps ───────────────────────────────────────────────────
+def has_column(conn, table, column):
+    return column in {c['name'] for c in inspect(conn).get_columns(table)}
+
+
+def add_column(conn, table, column, ddl, backfill=None):
+    """ALTER TABLE ... ADD COLUMN unless it exists. `backfill` runs only when added."""
+    if has_column(conn, table, column):
+        return False
+    conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+    if backfill:
+        conn.execute(text(backfill))
+    return True
+
+
+def create_table(db, conn, name):
+    db.metadata.tables[name].create(conn, checkfirst=True)
+
+
+def create_index(conn, name, table, columns):
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'))
+
+
+# ── Steps ───────────────────────────────────────────────────────────────
+@migration(1, 'Baseline: tables, legacy user columns, default settings')
+def _baseline(db, conn):
+    db.metadata.create_all(conn)
+
+    # Databases from the username/password era lack the Cloudflare columns
+    if add_column(conn, 'user', 'email', 'VARCHAR(150)'):
+        if has_column(conn, 'user', 'username'):
+            conn.execute(text('UPDATE "user" SET email = username'))
+    add_column(conn, 'user', 'username', 'VARCHAR(150)', 'UPDATE "user" SET username = email')
+    add_column(conn, 'user', 'password_hash', 'VARCHAR(150)', "UPDATE \"user\" SET password_hash = 'cloudflare_auth'")
+    add_column(conn, 'user', 'is_admin', 'BOOLEAN DEFAULT 0')
+
+    defaults = {'file_retention_minutes': '1440', 'shortener_domain': 'tools.l8tenever.de'}
+    existing = {row[0] for row in conn.execute(text('SELECT key FROM system_config'))}
+    for key, value in defaults.items():
+        if key not in existing:
+            conn.execute(text('INSERT INTO system_config (key, value) VALUES (:key, :value)'),
+                         {'key': key, 'value': value})
+
+
+@migration(2, 'Shortlink click analytics')
+def _shortlink_clicks(db, conn):
+    add_column(conn, 'shortlink', 'click_count', 'INTEGER DEFAULT 0')
+    add_column(conn, 'shortlink', 'last_clicked_at', 'DATETIME')
+    create_table(db, conn, 'shortlink_daily_clicks')
+
+
+@migration(3, 'Maintained poll vote counters')
+def _poll_vote_counters(db, conn):
+    add_column(conn, 'poll_option', 'vote_count', 'INTEGER DEFAULT 0',
+               'UPDATE poll_option SET vote_count = '
+               '(SELECT COUNT(*) FROM poll_vote WHERE poll_vote.poll_option_id = poll_option.id)')
+    add_column(conn, 'poll', 'results_version', 'INTEGER DEFAULT 0')
+
+
+@migration(4, 'Word cloud change version')
+def _word_cloud_version(db, conn):
+    add_column(conn, 'word_cloud', 'version', 'INTEGER DEFAULT 0')
+
+
+@migration(5, 'Word cloud word counts')
+def _word_cloud_word_counts(db, conn):
+    create_index(conn, 'ix_word_cloud_entry_cloud_word', 'word_cloud_entry', ['word_cloud_id', 'word'])
+    create_table(db, conn, 'word_cloud_word')
+    # Also covers old databases where the baseline step just created the empty table
+    if conn.execute(text('SELECT 1 FROM word_cloud_word LIMIT 1')).first() is None:
+        conn.execute(text('INSERT INTO word_cloud_word (word_cloud_id, word, count) '
+                          'SELECT word_cloud_id, word, COUNT(*) FROM word_cloud_entry GROUP BY word_cloud_id, word'))
+
+
+@migration(6, 'Resumable upload sessions')
+def _upload_sessions(db, conn):
+    create_table(db, conn, 'upload_session')
+
+
+@migration(7, 'Share scan status')
+def _share_scan_status(db, conn):
+    # Existing shares were uploaded before scanning existed and stay downloadable
+    add_column(conn, 'shared_file', 'scan_status', 'VARCHAR(20)', "UPDATE shared_file SET scan_status = 'clean'")
+    add_column(conn, 'shared_file', 'scan_message', 'VARCHAR(255)')
+
+
+@migration(8, 'Resumable share downloads')
+def _download_sessions(db, conn):
+    create_table(db, conn, 'download_session')
+
+
+@migration(9, 'Deduplicated share storage')
+def _share_blobs(db, conn):
+    # Existing shares keep their own files (blob_sha256 NULL) until they expire
+    create_table(db, conn, 'blob')
+    add_column(conn, 'shared_file', 'blob_sha256', 'VARCHAR(64)')
+    create_index(conn, 'ix_shared_file_blob_sha256', 'shared_file', ['blob_sha256'])
+
+
+@migration(10, 'Share expiry index')
+def _share_expiry_index(db, conn):
+    create_index(conn, 'ix_shared_file_expires_at', 'shared_file', ['expires_at'])
+
+
+@migration(11, 'Cap uncounted download resumes')
+def _download_session_resumed_bytes(db, conn):
+    add_column(conn, 'download_session', 'resumed_bytes', 'BIGINT DEFAULT 0')
+
+
+@migration(12, 'Share scan attempts')
+def _share_scan_attempts(db, conn):
+    add_column(conn, 'shared_file', 'scan_attempts', 'INTEGER DEFAULT 0')
+
+
+LATEST_VERSION = max(m[0] for m in MIGRATIONS)
+
+
+# ── Engine ──────────────────────────────────────────────────────────────
+def current_version(conn):
+    try:
+        return conn.execute(text('SELECT version FROM schema_version')).scalar() or 0
+    except Exception:
+        return 0
+
+
+def _set_version(conn, version):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+    if conn.execute(text('UPDATE schema_version SET version = :v'), {'v': version}).rowcount == 0:
+        conn.execute(text('INSERT INTO schema_version (version) VALUES (:v)'), {'v': version})
+
+
+def is_current(db):
+    with db.engine.connect() as conn:
+        return current_version(conn) >= LATEST_VERSION
+
+
+def upgrade(db, lock_path=None, verbose=False):
+    """Apply pending steps. Returns the list of applied (version, description)."""
+    if is_current(db):
+        return []
+
+    lock_file = None
+    if lock_path and fcntl:
+        # Workers booting at the same time wait for the first one to finish
+        lock_file = open(lock_path, 'a')
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+
+    applied = []
+    try:
+        with db.engine.connect() as conn:
+            version = current_version(conn)
+            conn.rollback()
+            for step_version, description, func in MIGRATIONS:
+                if step_version <= version:
+                    continue
+                with conn.begin():
+                    func(db, conn)
+                    _set_version(conn, step_version)
+                applied.append((step_version, description))
+                if verbose:
+                    print(f"[Migrate] {step_version:03d} {description}")
+    finally:
+        if lock_file:
+            lock_file.close()
+
+    return applied
+
+
+def status(db):
+    with db.engine.connect() as conn:
+        version = current_version(conn)
+    pending = [(v, d) for v, d, _ in MIGRATIONS if v > version]
+    return version, pending
+
@@ -0,0 +1,158 @@
+"""
+Rasterization of PDF pages for the file converter.
+
+PDF inputs with a PNG/JPG/WEBP target used to be rendered one page after
+the other at PyMuPDF's default 72 DPI, and every pixmap was copied into a
+PIL image before it was encoded. A 300-page scan kept one core busy for
+minutes and still came out blurry.
+
+`render()` takes the resolution and a page selection and spreads the pages
+over `workers` processes. Every worker opens the document once and renders
+the pages it is handed; results come back in page order, so the caller can
+pack them as they arrive. Only a few pages per worker are rendered ahead of
+the caller, a slow consumer holds back the pool instead of piling up pages. PNG and JPEG are encoded by MuPDF straight from
+the pixmap; WebP, which MuPDF cannot write, goes through a PIL image that
+shares the pixmap's buffer instead of copying it.
+
+Page selections use the print dialog syntax, 1-based: "1-3,7,10-".
+"""
+
+import collections
+import io
+import itertools
+import multiprocessing
+import re
+
+from PIL import Image
+
+from lazy_deps import deps
+
+DEFAULT_DPI = 72
+MIN_DPI = 36
+MAX_DPI = 600
+JPEG_QUALITY = 85
+
+# Below this many pages starting processes costs more than it saves
+MIN_PARALLEL_PAGES = 4
+# Pages rendered ahead per worker. imap would render the whole document
+# into memory when the consumer (a streamed ZIP) is slower than the pool
+PAGES_AHEAD_PER_WORKER = 2
+
+_RANGE = re.compile(r'^(\d+)?\s*(-)?\s*(\d+)?$')
+
+
+def parse_dpi(value, default=DEFAULT_DPI):
+    if value in (None, ''):
+        return default
+    try:
+        dpi = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Ungültige Auflösung: {value}")
+    if not MIN_DPI <= dpi <= MAX_DPI:
+        raise ValueError(f"Die Auflösung muss zwischen {MIN_DPI} und {MAX_DPI} DPI liegen")
+    return dpi
+
+
+def parse_pages(spec):
+    """
+    "1-3,7,10-" -> [(1, 3), (7, 7), (10, None)]. An empty selection is None
+    (all pages). Raises ValueError for anything else.
+    """
+    if not spec or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(','):
+        match = _RANGE.match(part.strip())
+        if not match or not (match.group(1) or match.group(3)):
+            raise ValueError(f"Ungültige Seitenauswahl: {part.strip() or spec}")
+        first, dash, last = match.groups()
+        first = int(first) if first else 1
+        last = int(last) if last else (None if dash else first)
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"Ungültige Seitenauswahl: {part.strip()}")
+        ranges.append((first, last))
+    return ranges
+
+
+def select_pages(ranges, page_count):
+    """0-based page numbers of `ranges` that exist, in document order."""
+    if ranges is None:
+        return list(range(page_count))
+    pages = set()
+    for first, last in ranges:
+        pages.update(range(first - 1, min(last or page_count, page_count)))
+    if not pages:
+        raise ValueError(f"Keine der gewählten Seiten vorhanden (das Dokument hat {page_count} Seiten)")
+    return sorted(pages)
+
+
+# ── Rendering ───────────────────────────────────────────────────────────
+def _encode(pix, target_format):
+    if target_format == 'png':
+        return pix.tobytes('png')
+    if target_format in ('jpg', 'jpeg'):
+        return pix.tobytes('jpg', jpg_quality=JPEG_QUALITY)
+    mode = 'RGB' if pix.n == 3 else 'L'
+    img = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, 'raw', mode, pix.stride, 1)
+    out = io.BytesIO()
+    img.save(out, format=target_format.upper())
+    return out.getvalue()
+
+
+def _render_page(doc, page_num, target_format, dpi):
+    pix = doc.load_page(page_num).get_pixmap(dpi=dpi, alpha=False)
+    return _encode(pix, target_format)
+
+
+# State of a worker process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(path, target_format, dpi):
+    _worker.update(doc=deps.load('fitz').open(path), target_format=target_format, dpi=dpi)
+
+
+def _worker_render(page_num):
+    return page_num, _render_page(_worker['doc'], page_num, _worker['target_format'], _worker['dpi'])
+
+
+def page_count(path):
+    doc = deps.load('fitz').open(path)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def render(path, target_format, dpi=DEFAULT_DPI, pages=None, workers=1):
+    """
+    Yield `(page_num, image bytes)` for the selected pages (list of 0-based
+    numbers, None for all) in order. Closing the generator early stops the
+    workers.
+    """
+    if pages is None:
+        pages = list(range(page_count(path)))
+    workers = min(workers or 1, len(pages))
+
+    if workers < 2 or len(pages) < MIN_PARALLEL_PAGES:
+        doc = deps.load('fitz').open(path)
+        try:
+            for page_num in pages:
+                yield page_num, _render_page(doc, page_num, target_format, dpi)
+        finally:
+            doc.close()
+        return
+
+    # fork: the workers inherit the loaded PyMuPDF instead of importing it again
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    # Leaving the with block terminates the pool, also on Cancelled
+    with context.Pool(workers, initializer=_init_worker, initargs=(path, target_format, dpi)) as pool:
+        queued = iter(pages)
+        pending = collections.deque(pool.apply_async(_worker_render, (page_num,))
+                                    for page_num in itertools.islice(queued, workers * PAGES_AHEAD_PER_WORKER))
+        while pending:
+            result = pending.popleft().get()
+            # Refill before yielding, the workers keep going while the caller packs
+            pending.extend(pool.apply_async(_worker_render, (page_num,)) for page_num in itertools.islice(queued, 1))
+            yield result
@@ -0,0 +1,61 @@
+"""
+Poll result aggregation for L8teTools.
+
+Votes are counted into `PollOption.vote_count` in the same transaction that
+stores the `PollVote` rows (see ingest.py), and every change bumps
+`Poll.results_version`. The results endpoint therefore never loads
+`PollVote` rows: it reads the option counters with one query, and identical
+results are served from a small per-process cache keyed by (poll id, slug,
+results_version) until the next vote arrives.
+"""
+
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+
+def bump_version(session, poll_id):
+    session.execute(text('UPDATE poll SET results_version = COALESCE(results_version, 0) + 1 WHERE id = :id'),
+                    {'id': poll_id})
+
+
+def compute_results(session, poll):
+    rows = session.execute(
+        text('SELECT id, text, COALESCE(vote_count, 0) FROM poll_option WHERE poll_id = :id ORDER BY id'),
+        {'id': poll.id}).all()
+    results = [{'id': option_id, 'text': option_text, 'votes': votes} for option_id, option_text, votes in rows]
+    return {
+        'title': poll.title,
+        'question': poll.question,
+        'results': results,
+        'total_votes': sum(r['votes'] for r in results)
+    }
+
+
+class ResultsCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session, poll):
+        """Return the results payload, computing it only when the poll changed."""
+        key = (poll.slug, poll.results_version or 0)
+        with self._lock:
+            entry = self._entries.get(poll.id)
+            if entry and entry[0] == key:
+                self._entries.move_to_end(poll.id)
+                return entry[1]
+
+        payload = compute_results(session, poll)
+        with self._lock:
+            self._entries[poll.id] = (key, payload)
+            self._entries.move_to_end(poll.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload
+
+    def invalidate(self, poll_id):
+        with self._lock:
+            self._entries.pop(poll_id, None)
@@ -13,17 +13,35 @@ SECURITY:
 - No directory listing, no file enumeration
 - Tokens are validated as hex UUIDs before DB lookup
 - File paths are validated to stay within the upload folder
+- Only files that passed the upload scan (scan_status 'clean') are served
+- Downloads support Range/If-Range (byte_ranges.py); resuming a download
+  within DOWNLOAD_SESSION_HOURS does not count against max_downloads, but
+  a session gets at most the file size in uncounted bytes. Beyond that a
+  "resume" (e.g. `Range: bytes=0-` over and over) is a new download
+- The client IP comes from the socket; a forwarding header is only used
+  when DOWNLOAD_CLIENT_IP_HEADER names the one set by our own proxy
+- A download is admitted by one conditional UPDATE of download_count, so
+  concurrent requests can never exceed max_downloads. Exhausted shares are
+  deleted later by the cleanup job of the main app, not by the request
+- DOWNLOAD_OFFLOAD=nginx|sendfile: checks and counting stay here, the file
+  itself is sent by the web server in front (see nginx.public.conf)
 - Security headers on every response
 - No error details leaked to the client
 """
 
+import hashlib
 import os
 import re
 import tempfile
-from flask import Flask, render_template, send_file, request, abort
+from urllib.parse import quote
+from flask import Flask, render_template, request, abort
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, or_, text, update
 from datetime import datetime, timedelta
 
+import blob_store
+import byte_ranges
+
 db = SQLAlchemy()
 
 # Strict token format: 32-char hex (UUID without dashes)
@@ -49,8 +67,21 @@ class SharedFile(db.Model):
     download_count = db.Column(db.Integer, default=0)
     first_accessed_at = db.Column(db.DateTime, nullable=True)
     access_window_hours = db.Column(db.Integer, default=4)
+    scan_status = db.Column(db.String(20), default='pending')
+    scan_message = db.Column(db.String(255))
+    blob_sha256 = db.Column(db.String(64))
 
     user = db.relationship('User', backref=db.backref('shared_files', lazy=True))
+    download_sessions = db.relationship('DownloadSession', lazy=True, cascade='all, delete-orphan')
+
+
+class DownloadSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    shared_file_id = db.Column(db.String(36), db.ForeignKey('shared_file.id'), nullable=False)
+    client_key = db.Column(db.String(64), nullable=False)
+    resumed_bytes = db.Column(db.BigInteger, default=0)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    last_seen_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
 
 # ── App factory ─────────────────────────────────────────────────────────
@@ -63,6 +94,12 @@ def create_public_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or 'sqlite:///users.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = os.path.join(tempfile.gettempdir(), 'l8te_uploads')
+    download_session_window = timedelta(hours=float(os.environ.get('DOWNLOAD_SESSION_HOURS', 6)))
+    # '' = Python streams the file, 'nginx' = X-Accel-Redirect, 'sendfile' = X-Sendfile
+    offload = os.environ.get('DOWNLOAD_OFFLOAD', '').strip().lower()
+    offload_prefix = '/' + os.environ.get('DOWNLOAD_OFFLOAD_PREFIX', '/_protected_uploads/').strip('/') + '/'
+    # Only set behind a proxy that overwrites it, e.g. CF-Connecting-IP or X-Forwarded-For
+    client_ip_header = os.environ.get('DOWNLOAD_CLIENT_IP_HEADER', '').strip()
 
     # No sessions/cookies needed on this server
     app.config['SESSION_COOKIE_HTTPONLY'] = True
@@ -70,6 +107,15 @@ def create_public_app():
 
     db.init_app(app)
 
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            @event.listens_for(db.engine, 'connect')
+            def sqlite_pragmas(dbapi_connection, connection_record):
+                # Parallel downloads wait for the write lock instead of failing
+                cursor = dbapi_connection.cursor()
+                cursor.execute('PRAGMA busy_timeout = 10000')
+                cursor.close()
+
     # ── Security headers on every response ───────────────────────────
     @app.after_request
     def add_security_headers(response):
@@ -86,15 +132,17 @@ def create_public_app():
             "connect-src 'none'; "
             "frame-ancestors 'none';"
         )
-        # Prevent caching of download pages (tokens can expire)
-        response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        response.headers['Pragma'] = 'no-cache'
+        # Prevent caching of download pages (tokens can expire). File
+        # responses set their own header so clients can revalidate ranges.
+        if 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+            response.headers['Pragma'] = 'no-cache'
         return response
 
-    # ── Block all HTTP methods except GET ────────────────────────────
+    # ── Block all HTTP methods except GET (and HEAD for download managers)
     @app.before_request
     def block_non_get():
-        if request.method != 'GET':
+        if request.method not in ('GET', 'HEAD'):
             abort(405)
 
     # ── Helpers ──────────────────────────────────────────────────────
@@ -113,25 +161,87 @@ def create_public_app():
         return real_path
 
     def delete_shared_file(file_obj):
-        try:
-            if os.path.exists(file_obj.filepath):
-                os.remove(file_obj.filepath)
-        except Exception:
-            pass
-        db.session.delete(file_obj)
+        # Another request or the share-expiry sweep may delete the same share
+        # concurrently: only the DELETE that removed the row gives the blob
+        # reference back. The file may be shared by other links with the same content
+        sha256, filepath = file_obj.blob_sha256, file_obj.filepath
+        db.session.expunge(file_obj)
+        db.session.execute(text('DELETE FROM download_session WHERE shared_file_id = :id'), {'id': file_obj.id})
+        if db.session.execute(text('DELETE FROM shared_file WHERE id = :id'), {'id': file_obj.id}).rowcount == 1:
+            blob_store.release(db.session, sha256, filepath)
         db.session.commit()
 
-    def check_expiration(f):
+    def check_expiration(f, resuming=False):
         """Returns an error tuple (message, status_code) if expired, else None."""
         if f.expires_at and datetime.now() > f.expires_at:
             delete_shared_file(f)
             return ("Dieser Link ist abgelaufen.", 410)
-        if f.max_downloads != -1 and f.download_count >= f.max_downloads:
-            delete_shared_file(f)
+        # A resumed download was already counted when it started. The file
+        # stays until the cleanup job, other clients may still be resuming.
+        if not resuming and f.max_downloads != -1 and f.download_count >= f.max_downloads:
             return ("Download-Limit erreicht.", 410)
         return None
 
-    def get_shared_file(token):
+    def admit_download(f):
+        """
+        Count one download with a single conditional UPDATE. Returns False
+        if the share is used up or expired by now; of several concurrent
+        requests for the last download exactly one is admitted.
+        """
+        result = db.session.execute(
+            update(SharedFile)
+            .where(SharedFile.id == f.id,
+                   or_(SharedFile.max_downloads == -1, SharedFile.download_count < SharedFile.max_downloads),
+                   or_(SharedFile.expires_at.is_(None), SharedFile.expires_at > datetime.now()))
+            .values(download_count=SharedFile.download_count + 1)
+            .execution_options(synchronize_session=False))
+        return result.rowcount == 1
+
+    def offload_target(path):
+        """Header and value that hand `path` to the fronting web server."""
+        if offload == 'nginx':
+            relative = os.path.relpath(path, os.path.realpath(app.config['UPLOAD_FOLDER']))
+            return 'X-Accel-Redirect', offload_prefix + quote(relative.replace(os.sep, '/'))
+        return 'X-Sendfile', path
+
+    def client_ip():
+        # Anyone can send forwarding headers, only our proxy's value counts.
+        # X-Forwarded-For: the proxy appends the address it saw, so the last one
+        if client_ip_header:
+            forwarded = request.headers.get(client_ip_header, '').split(',')[-1].strip()
+            if forwarded:
+                return forwarded
+        return request.remote_addr or ''
+
+    def client_key():
+        """Identify a downloading client without storing its IP address."""
+        ip = client_ip()
+        return hashlib.sha256(f"{ip}|{request.headers.get('User-Agent', '')}".encode()).hexdigest()
+
+    def find_download_session(token, key):
+        if not validate_token(token):
+            return None
+        return DownloadSession.query.filter(
+            DownloadSession.shared_file_id == token,
+            DownloadSession.client_key == key,
+            DownloadSession.last_seen_at > datetime.now() - download_session_window,
+        ).first()
+
+    def resume_download(session, size, length):
+        """
+        Book `length` uncounted bytes on `session` with one conditional UPDATE.
+        Returns False once the session would exceed the file size, so a
+        client cannot download the file again and again as "resumes".
+        """
+        result = db.session.execute(
+            update(DownloadSession)
+            .where(DownloadSession.id == session.id,
+                   DownloadSession.resumed_bytes + length <= size)
+            .values(resumed_bytes=DownloadSession.resumed_bytes + length, last_seen_at=datetime.now())
+            .execution_options(synchronize_session=False))
+        return result.rowcount == 1
+
+    def get_shared_file(token, resuming=False):
         """Validate token, look up file, check expiration. Returns (file, error_response)."""
         if not validate_token(token):
             return None, (render_template('download_404.html'), 404)
@@ -140,19 +250,31 @@ def create_public_app():
         if not f:
             return None, (render_template('download_404.html'), 404)
 
+        expired = check_expiration(f, resuming)
+        if expired:
+            return None, (render_template('download_expired.html', message=expired[0]), expired[1])
+
+        # Nothing is served before the upload scan has passed (see file_scan.py)
+        if f.scan_status == 'pending':
+            return None, (render_template('download_pending.html'), 503, {'Retry-After': '5'})
+        if f.scan_status != 'clean':
+            return None, (render_template('download_expired.html', title='Datei gesperrt',
+                                          message="Diese Datei wurde bei der Sicherheitsprüfung gesperrt."), 403)
+
         # Validate file path hasn't been tampered with
         if not validate_filepath(f.filepath):
             return None, (render_template('download_404.html'), 404)
 
-        expired = check_expiration(f)
-        if expired:
-            return None, (render_template('download_expired.html', message=expired[0]), expired[1])
-
         # Open mode: start timer on first view
         if f.expiration_mode == 'open':
             if not f.first_accessed_at:
-                f.first_accessed_at = datetime.now()
-                f.expires_at = datetime.now() + timedelta(hours=f.access_window_hours)
+                # Conditional, so concurrent first views cannot restart the timer
+                now = datetime.now()
+                db.session.execute(
+                    update(SharedFile)
+                    .where(SharedFile.id == f.id, SharedFile.first_accessed_at.is_(None))
+                    .values(first_accessed_at=now, expires_at=now + timedelta(hours=f.access_window_hours))
+                    .execution_options(synchronize_session=False))
                 db.session.commit()
             elif datetime.now() > f.expires_at:
                 delete_shared_file(f)
@@ -184,7 +306,14 @@ def create_public_app():
 
     @app.route('/s/<token>/download')
     def shared_file_download(token):
-        f, error = get_shared_file(token)
+        # Range/conditional requests and HEAD probes from a client that
+        # already started this download continue it instead of starting anew
+        key = client_key()
+        resumed = None
+        if request.method == 'HEAD' or any(h in request.headers for h in ('Range', 'If-Range', 'If-None-Match')):
+            resumed = find_download_session(token, key)
+
+        f, error = get_shared_file(token, resuming=resumed is not None)
         if error:
             return error
 
@@ -193,14 +322,33 @@ def create_public_app():
             delete_shared_file(f)
             return render_template('download_404.html'), 404
 
-        f.download_count += 1
-        db.session.commit()
-
         try:
-            return send_file(f.filepath, as_attachment=True, download_name=f.filename)
+            if offload in ('nginx', 'sendfile'):
+                # The web server answers Range and conditional requests itself
+                header, target = offload_target(validate_filepath(f.filepath))
+                response = byte_ranges.offload_response(header, target, f.filename)
+            else:
+                response, _ = byte_ranges.range_response(request, f.filepath, f.filename)
         except Exception:
             return render_template('download_404.html'), 500
 
+        if resumed is not None and request.method == 'GET' and response.status_code in (200, 206):
+            size = os.path.getsize(f.filepath)
+            if not resume_download(resumed, size, byte_ranges.body_bytes(request, f.filepath)):
+                db.session.rollback()
+                resumed = None
+        elif resumed is not None:
+            resumed.last_seen_at = datetime.now()
+        if resumed is not None:
+            db.session.commit()
+        elif request.method == 'GET' and response.status_code in (200, 206):
+            if not admit_download(f):
+                db.session.rollback()
+                return render_template('download_expired.html', message="Download-Limit erreicht."), 410
+            db.session.add(DownloadSession(shared_file_id=f.id, client_key=key))
+            db.session.commit()
+        return response
+
     # ── Landing page (no info leaked) ────────────────────────────────
     @app.route('/')
     def index():
@@ -0,0 +1,222 @@
+"""
+Streaming receiver for multipart share uploads.
+
+`api_file_upload` used to let Werkzeug spool every part to a temp file, copy
+each one into another temp file and then `zf.write()` it into the archive,
+so every byte hit the disk at least three times. `receive_upload()` parses
+the multipart body itself with Werkzeug's sans-IO decoder and writes each
+part straight to its destination:
+
+- A single file goes to a file under UPLOAD_FOLDER and is hashed on the
+  way for the blob store (blob_store.py)
+- Several files go directly into ZIP entries of the final archive. The
+  client sends `file_count` before the files; if it is missing, the first
+  file is moved into the archive once a second one shows up
+
+Entries are deflated only when that helps: images, video, audio, archives
+and Office documents are already compressed and are stored as-is (see
+`compression_for`). The archive reports its compression ratio and the time
+spent writing it.
+"""
+
+import os
+import time
+import uuid
+import zipfile
+from datetime import datetime
+
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+from blob_store import HashingWriter
+
+READ_BLOCK = 1024 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+
+# Formats with their own compression: deflating them costs CPU for ~0 % gain
+STORED_EXTENSIONS = frozenset((
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.heif', '.avif',
+    '.mp4', '.m4v', '.mov', '.mkv', '.webm', '.avi',
+    '.mp3', '.m4a', '.aac', '.ogg', '.opus', '.flac',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub', '.jar', '.apk',
+))
+
+
+def compression_for(filename):
+    if os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class ArchiveWriter:
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, 'w', allowZip64=True)
+        self._names = set()
+        self.files = 0
+        self.raw_bytes = 0
+        self.write_seconds = 0.0
+
+    def _unique_name(self, filename):
+        name = filename.replace('\\', '/').lstrip('/') or 'datei'
+        base, ext = os.path.splitext(name)
+        n = 1
+        while name in self._names:
+            n += 1
+            name = f"{base} ({n}){ext}"
+        self._names.add(name)
+        return name
+
+    def open_entry(self, filename):
+        info = zipfile.ZipInfo(self._unique_name(filename), date_time=datetime.now().timetuple()[:6])
+        info.compress_type = compression_for(filename)
+        self.files += 1
+        return _TimedEntry(self, self._zip.open(info, 'w', force_zip64=True))
+
+    def add_file(self, filename, path):
+        with open(path, 'rb') as src, self.open_entry(filename) as dest:
+            while True:
+                block = src.read(READ_BLOCK)
+                if not block:
+                    break
+                dest.write(block)
+
+    def close(self):
+        started = time.perf_counter()
+        self._zip.close()
+        self.write_seconds += time.perf_counter() - started
+        zip_bytes = os.path.getsize(self.path)
+        return {
+            'files': self.files,
+            'raw_bytes': self.raw_bytes,
+            'zip_bytes': zip_bytes,
+            'ratio': round(zip_bytes / self.raw_bytes, 3) if self.raw_bytes else 1.0,
+            'build_ms': round(self.write_seconds * 1000),
+        }
+
+    def abort(self):
+        try:
+            self._zip.close()
+        except Exception:
+            pass
+
+
+class _TimedEntry:
+    """ZIP entry stream that adds its write time and size to the archive stats."""
+
+    def __init__(self, archive, stream):
+        self.archive = archive
+        self.stream = stream
+
+    def write(self, data):
+        started = time.perf_counter()
+        self.stream.write(data)
+        self.archive.write_seconds += time.perf_counter() - started
+        self.archive.raw_bytes += len(data)
+
+    def close(self):
+        started = time.perf_counter()
+        self.stream.close()
+        self.archive.write_seconds += time.perf_counter() - started
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _blocks(stream):
+    while True:
+        data = stream.read(READ_BLOCK)
+        if not data:
+            break
+        yield data
+    yield None
+
+
+def _file_count(fields):
+    value = fields.get('file_count') or '1'
+    if not value.strip().isdigit():
+        raise BadRequest('Ungültige Dateianzahl')
+    return int(value)
+
+
+def receive_upload(stream, boundary, upload_folder):
+    """
+    Parse a multipart share upload from `stream`.
+
+    Returns (fields, filename, path, sha256, archive_stats). For a single
+    file `sha256` is its content hash and `archive_stats` is None; for an
+    archive `sha256` is None. Returns filename None if the body held no file.
+    """
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    fields = {}
+    first = None  # (filename, path) of a single file written as-is
+    first_hash = None
+    archive = None
+    part = sink = field_data = None
+
+    def open_archive():
+        path = os.path.join(upload_folder, f"archive_{uuid.uuid4().hex[:8]}.zip")
+        writer = ArchiveWriter(path)
+        if first:
+            # Client did not announce several files: move the first one in
+            writer.add_file(*first)
+            os.remove(first[1])
+        return writer
+
+    try:
+        for chunk in _blocks(stream):
+            decoder.receive_data(chunk)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    part, field_data = event, []
+                elif isinstance(event, File):
+                    part = event
+                    if not event.filename:
+                        sink = None
+                    elif archive is None and first is None and _file_count(fields) <= 1:
+                        path = os.path.join(upload_folder,
+                                            f"{uuid.uuid4().hex}_{secure_filename(event.filename) or 'datei'}")
+                        first = (event.filename, path)
+                        sink = first_hash = HashingWriter(open(path, 'wb'))
+                    else:
+                        if archive is None:
+                            archive = open_archive()
+                            first = None
+                        sink = archive.open_entry(event.filename)
+                elif isinstance(event, Data):
+                    if isinstance(part, Field):
+                        field_data.append(event.data)
+                        if sum(len(d) for d in field_data) > MAX_FIELD_BYTES:
+                            raise RequestEntityTooLarge()
+                        if not event.more_data:
+                            fields[part.name] = b''.join(field_data).decode('utf-8', 'replace')
+                    elif sink is not None:
+                        sink.write(event.data)
+                        if not event.more_data:
+                            sink.close()
+                            sink = None
+                event = decoder.next_event()
+    except Exception as e:
+        if sink is not None:
+            sink.close()
+        if archive is not None:
+            archive.abort()
+            os.remove(archive.path)
+        if first and os.path.exists(first[1]):
+            os.remove(first[1])
+        if isinstance(e, ValueError):
+            # MultipartDecoder rejects truncated or malformed bodies with ValueError
+            raise BadRequest('Ungültiger Upload') from e
+        raise
+
+    if archive is not None:
+        return fields, os.path.basename(archive.path), archive.path, None, archive.close()
+    if first:
+        return fields, first[0], first[1], first_hash.hexdigest(), None
+    return fields, None, None, None, None
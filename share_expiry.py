@@ -0,0 +1,86 @@
+"""
+Background expiry of shared files.
+
+`api_files_list` used to delete expired shares before every listing: a full
+scan of `shared_file.expires_at` and one commit per deleted row, on the
+request path. Shares that ran out of downloads were only noticed when
+someone accessed them. `sweep()` now runs as the `share-expiry` job and
+covers all three expiration modes:
+
+- 'time' and opened 'open' shares: `expires_at` has passed. Found through
+  the index on `expires_at`, oldest first
+- 'download' (any share with `max_downloads`): the limit is reached and no
+  client is resuming a download anymore (see public_server.py)
+
+Each batch of up to BATCH_SIZE shares is deleted in one transaction: the
+download sessions go with one DELETE, then every share row with its own.
+Blob references (blob_store.py) are given back only for the rows those
+DELETEs actually removed, grouped per content, so a share deleted
+concurrently by a request is never released twice. Only plain SQL is
+used, like file_scan.py.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, text
+
+import blob_store
+
+BATCH_SIZE = 500
+
+_EXPIRED_BY_TIME = text(
+    'SELECT id, filepath, blob_sha256 FROM shared_file WHERE expires_at < :now '
+    'ORDER BY expires_at LIMIT :limit').bindparams(bindparam('now', type_=DateTime))
+
+_EXHAUSTED = text(
+    'SELECT id, filepath, blob_sha256 FROM shared_file '
+    'WHERE max_downloads != -1 AND download_count >= max_downloads '
+    'AND NOT EXISTS (SELECT 1 FROM download_session '
+    '                WHERE shared_file_id = shared_file.id AND last_seen_at > :cutoff) '
+    'LIMIT :limit').bindparams(bindparam('cutoff', type_=DateTime))
+
+
+def _delete_batch(session, rows):
+    """Delete `rows` in one transaction. Returns how many were still there to delete."""
+    ids = bindparam('ids', expanding=True)
+    session.execute(text('DELETE FROM download_session WHERE shared_file_id IN :ids').bindparams(ids),
+                    {'ids': [row[0] for row in rows]})
+
+    # The SELECT did not lock anything: the main app, the public server or
+    # another sweep may have deleted a share since. Only rows this DELETE
+    # removed give their blob reference back
+    blobs = Counter()
+    deleted = 0
+    for share_id, filepath, sha256 in rows:
+        if session.execute(text('DELETE FROM shared_file WHERE id = :id'), {'id': share_id}).rowcount != 1:
+            continue
+        deleted += 1
+        if sha256:
+            blobs[(sha256, filepath)] += 1
+        else:
+            blob_store.release(session, None, filepath)
+    for (sha256, filepath), references in blobs.items():
+        blob_store.release(session, sha256, filepath, references)
+    session.commit()
+    return deleted
+
+
+def sweep(session, session_cutoff, now=None, batch_size=BATCH_SIZE):
+    """
+    Delete expired shares. Download-limited shares are kept while one of
+    their download sessions was active after `session_cutoff`.
+    Returns {'expired': n, 'exhausted': n}.
+    """
+    now = now or datetime.now()
+    counts = {'expired': 0, 'exhausted': 0}
+    for kind, query, params in (('expired', _EXPIRED_BY_TIME, {'now': now}),
+                                ('exhausted', _EXHAUSTED, {'cutoff': session_cutoff})):
+        while True:
+            rows = session.execute(query, dict(params, limit=batch_size)).all()
+            if not rows:
+                break
+            counts[kind] += _delete_batch(session, rows)
+            if len(rows) < batch_size:
+                break
+    return counts
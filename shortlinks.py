@@ -0,0 +1,141 @@
+"""
+In-memory slug index and write-behind click counter for shortlinks.
+
+Shortlinks are handed out in mailings and get hit in bursts. Instead of one
+`Shortlink` query (plus the Cloudflare auth hook) per redirect, each process
+keeps a slug -> target map in memory. `api_add_shortlink` and
+`api_delete_shortlink` call `changed()`, which reloads the local map and
+bumps the `shortlinks_version` setting; other workers notice the new
+version through the cached config store and reload their map.
+
+Clicks are counted in memory by `ClickCounter` and written every few
+seconds (CLICK_FLUSH_SECONDS) in a single transaction: total count and
+last hit on `shortlink`, per-day buckets in `shortlink_daily_clicks`. A
+synchronous UPDATE per redirect would serialize on SQLite's write lock.
+Pending counts are flushed at interpreter exit as well.
+"""
+
+import atexit
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import Date, DateTime, bindparam, text
+
+VERSION_KEY = 'shortlinks_version'
+
+
+class SlugIndex:
+    def __init__(self, db, config):
+        self.db = db
+        self.config = config
+        self._targets = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _load(self, version):
+        rows = self.db.session.execute(text('SELECT id, slug, target_url FROM shortlink')).all()
+        self._targets = {slug.lower(): (link_id, target) for link_id, slug, target in rows}
+        self._version = version
+
+    def lookup(self, slug):
+        """Return (link_id, target_url) for a slug or None. Needs an app context."""
+        version = self.config.get(VERSION_KEY)
+        if self._targets is None or version != self._version:
+            with self._lock:
+                if self._targets is None or version != self._version:
+                    self._load(version)
+        return self._targets.get(slug.lower())
+
+    def changed(self):
+        """Call after shortlinks were added or removed (after commit)."""
+        self.config.set(VERSION_KEY, uuid.uuid4().hex)
+        with self._lock:
+            self._load(self.config.get(VERSION_KEY))
+
+    def __len__(self):
+        return len(self._targets or {})
+
+
+class ClickCounter:
+    def __init__(self, app, db, flush_seconds=5):
+        self.app = app
+        self.db = db
+        self.flush_seconds = flush_seconds
+        self._totals = defaultdict(int)
+        self._last_hit = {}
+        self._daily = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def record(self, link_id):
+        now = datetime.now()
+        with self._lock:
+            self._totals[link_id] += 1
+            self._last_hit[link_id] = now
+            self._daily[(link_id, now.date())] += 1
+        if self._thread is None:
+            self._start()
+
+    def pending(self, link_id):
+        return self._totals.get(link_id, 0)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._flush_loop, name='click-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Clicks] Flush failed: {e}")
+
+    def flush(self):
+        """Write all pending counts in one transaction. Returns the number of clicks written."""
+        with self._flush_lock:
+            with self._lock:
+                totals, last_hit, daily = self._totals, self._last_hit, self._daily
+                self._totals, self._last_hit, self._daily = defaultdict(int), {}, defaultdict(int)
+            if not totals:
+                return 0
+
+            try:
+                with self.app.app_context():
+                    session = self.db.session
+                    session.execute(
+                        text('UPDATE shortlink SET click_count = COALESCE(click_count, 0) + :n, '
+                             'last_clicked_at = :ts WHERE id = :id').bindparams(bindparam('ts', type_=DateTime)),
+                        [{'id': link_id, 'n': n, 'ts': last_hit[link_id]} for link_id, n in totals.items()])
+                    for (link_id, day), n in daily.items():
+                        params = {'id': link_id, 'day': day, 'n': n}
+                        updated = session.execute(
+                            text('UPDATE shortlink_daily_clicks SET count = count + :n '
+                                 'WHERE shortlink_id = :id AND day = :day').bindparams(bindparam('day', type_=Date)),
+                            params)
+                        if updated.rowcount == 0:
+                            # Links deleted since the click are skipped
+                            session.execute(
+                                text('INSERT INTO shortlink_daily_clicks (shortlink_id, day, count) '
+                                     'SELECT :id, :day, :n WHERE EXISTS (SELECT 1 FROM shortlink WHERE id = :id)'
+                                     ).bindparams(bindparam('day', type_=Date)),
+                                params)
+                    session.commit()
+            except Exception:
+                # Put the counts back so the next flush retries them
+                with self._lock:
+                    for link_id, n in totals.items():
+                        self._totals[link_id] += n
+                        self._last_hit.setdefault(link_id, last_hit[link_id])
+                    for key, n in daily.items():
+                        self._daily[key] += n
+                raise
+            return sum(totals.values())
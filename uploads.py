@@ -0,0 +1,104 @@
+"""
+Resumable chunked uploads for file sharing.
+
+A single multipart request for a large share starts over from zero when the
+connection drops, and Werkzeug spools the body to a temp file before it is
+copied to UPLOAD_FOLDER. The chunked protocol avoids both:
+
+    POST   /api/files/uploads                  {filename, size, mode, hours} -> {id, offset}
+    GET    /api/files/uploads/<id>             -> {offset, size}
+    PUT    /api/files/uploads/<id>?offset=N    raw chunk, header X-Chunk-SHA256 -> {offset}
+    POST   /api/files/uploads/<id>/finalize    -> {token}
+    DELETE /api/files/uploads/<id>
+
+Chunks are read from `request.stream` and written straight into the final
+file under UPLOAD_FOLDER while being hashed. A chunk whose SHA-256 does not
+match is cut off again, so the stored offset only ever covers verified
+bytes. Finalizing just creates the `SharedFile` row for that file; nothing
+is copied. Sessions idle for longer than SESSION_MAX_AGE are removed by the
+cleanup job.
+"""
+
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, single-process dev setup
+    fcntl = None
+
+CHUNK_MAX_BYTES = 16 * 1024 * 1024
+READ_BLOCK = 1024 * 1024
+SESSION_MAX_AGE = timedelta(hours=24)
+
+
+class ChunkError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def create_file(path):
+    # Exclusive create: a session never reuses an existing file
+    with open(path, 'xb'):
+        pass
+
+
+@contextmanager
+def open_locked(path):
+    """Open the upload file for writing; only one request may write at a time."""
+    with open(path, 'r+b') as f:
+        if fcntl:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise ChunkError('Upload wird bereits von einer anderen Anfrage geschrieben', 409)
+        yield f
+
+
+def write_chunk(f, offset, stream, length, expected_sha256):
+    """
+    Write `length` bytes from `stream` at `offset`. Returns the new offset.
+
+    Raises ChunkError if the body is shorter than announced or the checksum
+    does not match. In every case the file ends at the last verified byte.
+    """
+    if not length or length <= 0:
+        raise ChunkError('Leerer Block')
+    if length > CHUNK_MAX_BYTES:
+        raise ChunkError('Block zu groß', 413)
+    if not expected_sha256:
+        raise ChunkError('X-Chunk-SHA256 fehlt')
+
+    # The file may still hold bytes of an earlier chunk that failed half-way
+    f.truncate(offset)
+    f.seek(offset)
+    digest = hashlib.sha256()
+    remaining = length
+    while remaining:
+        block = stream.read(min(READ_BLOCK, remaining))
+        if not block:
+            break
+        f.write(block)
+        digest.update(block)
+        remaining -= len(block)
+
+    if remaining:
+        f.truncate(offset)
+        raise ChunkError('Block unvollständig', 422)
+    if digest.hexdigest() != expected_sha256.lower():
+        f.truncate(offset)
+        raise ChunkError('Prüfsumme stimmt nicht', 422)
+
+    f.flush()
+    os.fsync(f.fileno())
+    return offset + length
+
+
+def discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
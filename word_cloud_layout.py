@@ -0,0 +1,286 @@
+"""
+Server-side word cloud layout and rendering.
+
+The browser used to lay out every word from scratch on each refresh, which
+is slow on the projector laptops once a cloud has a few hundred distinct
+words. The layout is now computed here, once per cloud version, and served
+as a position list, SVG or PNG:
+
+- Word sizes depend only on the word's own count (log scale), so a new vote
+  for one word does not resize all others
+- Words are placed along an elliptical spiral from the center. Free space
+  is tracked in a NumPy occupancy bitmap (CELL px per cell); all spiral
+  candidates for a word are checked at once with a summed-area table
+- Layouts are incremental: unchanged words keep their position from the
+  previous version, only new or resized words are placed. If one does not
+  fit anymore, everything is laid out again at a smaller scale; below
+  MIN_SCALE the rarest words are left out
+- `LayoutCache` keeps the last layout per cloud and renders SVG/PNG lazily
+  for that version only
+
+Text is measured with the font in WORDCLOUD_FONT (default: DejaVu Sans
+Bold, or Pillow's built-in font, which takes a size since Pillow 10.1).
+The SVG pins every word to the measured width with `textLength`, so
+browsers with other fonts do not overlap.
+"""
+
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from PIL import Image, ImageDraw, ImageFont
+
+from lazy_deps import deps
+
+WIDTH, HEIGHT = 1000, 500
+CELL = 4
+PADDING = 4
+MIN_FONT, MAX_FONT = 18, 96
+MIN_SCALE = 0.3
+FILL = 0.35
+
+COLORS = ['#6750A4', '#9333ea', '#db2777', '#dc2626', '#ea580c',
+          '#0284c7', '#16a34a', '#0891b2', '#4f46e5', '#7d5260']
+
+FONT_CANDIDATES = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf',
+    '/Library/Fonts/Arial Bold.ttf',
+    'C:\\Windows\\Fonts\\arialbd.ttf',
+]
+
+
+@lru_cache(maxsize=1)
+def _font_path():
+    configured = os.environ.get('WORDCLOUD_FONT')
+    for path in ([configured] if configured else []) + FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+@lru_cache(maxsize=128)
+def _font(size):
+    path = _font_path()
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+
+def _color(text):
+    # Same hash as the old client-side renderer, so words keep their colors
+    h = 0
+    for ch in text:
+        shifted = ((h & 0xFFFFFFFF) << 5) & 0xFFFFFFFF
+        if shifted >= 0x80000000:
+            shifted -= 0x100000000
+        h32 = h & 0xFFFFFFFF
+        if h32 >= 0x80000000:
+            h32 -= 0x100000000
+        h = ord(ch) + shifted - h32
+    return COLORS[abs(h) % len(COLORS)]
+
+
+def font_size(count, scale=1.0):
+    size = MIN_FONT + 14 * math.log2(max(count, 1))
+    return max(8, int(min(size, MAX_FONT) * scale))
+
+
+@lru_cache(maxsize=1)
+def _spiral():
+    """Cell offsets from the center along an elliptical spiral, nearest first."""
+    np = deps.load('numpy')
+    t = np.arange(0, 400, 0.05)
+    radius = 0.6 * t
+    dx = np.round(radius * np.cos(t) * (WIDTH / HEIGHT)).astype(np.int32)
+    dy = np.round(radius * np.sin(t)).astype(np.int32)
+    keep = (np.abs(dx) <= WIDTH // CELL) & (np.abs(dy) <= HEIGHT // CELL)
+    points = np.stack([dx[keep], dy[keep]], axis=1)
+    _, first = np.unique(points, axis=0, return_index=True)
+    return points[np.sort(first)]
+
+
+def _measure(text, size):
+    left, top, right, bottom = _font(size).getbbox(text, anchor='mm')
+    return right - left, bottom - top
+
+
+class _Grid:
+    def __init__(self):
+        np = deps.load('numpy')
+        self.np = np
+        self.cols, self.rows = WIDTH // CELL, HEIGHT // CELL
+        self.cells = np.zeros((self.rows, self.cols), dtype=bool)
+
+    def _cell_box(self, word):
+        cw = math.ceil((word['w'] + PADDING) / CELL)
+        ch = math.ceil((word['h'] + PADDING) / CELL)
+        return cw, ch
+
+    def mark(self, word):
+        cw, ch = self._cell_box(word)
+        x0 = int(word['x'] / CELL) - cw // 2
+        y0 = int(word['y'] / CELL) - ch // 2
+        self.cells[max(y0, 0):y0 + ch, max(x0, 0):x0 + cw] = True
+
+    def place(self, word):
+        """Find the first free spot on the spiral. Sets x/y and returns True if found."""
+        np = self.np
+        cw, ch = self._cell_box(word)
+        if cw > self.cols or ch > self.rows:
+            return False
+
+        # Summed-area table: occupied cells in any rectangle with four lookups
+        sat = np.zeros((self.rows + 1, self.cols + 1), dtype=np.int32)
+        sat[1:, 1:] = self.cells.cumsum(0).cumsum(1)
+
+        spiral = _spiral()
+        x0 = self.cols // 2 + spiral[:, 0] - cw // 2
+        y0 = self.rows // 2 + spiral[:, 1] - ch // 2
+        inside = (x0 >= 0) & (y0 >= 0) & (x0 + cw <= self.cols) & (y0 + ch <= self.rows)
+        x0, y0 = x0[inside], y0[inside]
+        x1, y1 = x0 + cw, y0 + ch
+        occupied = sat[y1, x1] - sat[y0, x1] - sat[y1, x0] + sat[y0, x0]
+        free = np.flatnonzero(occupied == 0)
+        if not len(free):
+            return False
+
+        i = free[0]
+        word['x'] = int((x0[i] + cw // 2) * CELL)
+        word['y'] = int((y0[i] + ch // 2) * CELL)
+        self.mark(word)
+        return True
+
+
+def _sized(text, count, scale):
+    size = font_size(count, scale)
+    w, h = _measure(text, size)
+    return {'text': text, 'count': count, 'font_size': size, 'w': w, 'h': h, 'color': _color(text)}
+
+
+def _layout_all(counts, scale):
+    """Place every word at the given scale. Returns (words, skipped)."""
+    grid = _Grid()
+    placed, skipped = [], []
+    for text, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+        word = _sized(text, count, scale)
+        (placed if grid.place(word) else skipped).append(word)
+    return placed, skipped
+
+
+def build_layout(words, previous=None):
+    """
+    Lay out [{'text', 'size'}] (the word cloud data payload).
+
+    With a previous layout only new or resized words are placed; the rest
+    keep their position. Returns a dict with width, height, scale and words.
+    """
+    counts = {w['text']: w['size'] for w in words}
+    scale = previous['scale'] if previous else 1.0
+
+    if previous:
+        grid = _Grid()
+        kept = {}
+        for word in previous['words']:
+            count = counts.get(word['text'])
+            if count is not None and font_size(count, scale) == word['font_size']:
+                word = dict(word, count=count)
+                kept[word['text']] = word
+                grid.mark(word)
+
+        new = [_sized(text, count, scale) for text, count in counts.items() if text not in kept]
+        new.sort(key=lambda w: (-w['count'], w['text']))
+        placed = [word for word in new if grid.place(word)]
+        if len(placed) == len(new) or scale <= MIN_SCALE:
+            return {'width': WIDTH, 'height': HEIGHT, 'scale': scale, 'words': list(kept.values()) + placed}
+
+    # Full layout, shrinking until every word fits. Start from an estimate
+    # that fills about a third of the canvas, leaving room for new words.
+    area = 0
+    for text, count in counts.items():
+        w, h = _measure(text, font_size(count, scale))
+        area += (w + PADDING) * (h + PADDING)
+    if area > WIDTH * HEIGHT * FILL:
+        scale = max(MIN_SCALE, round(scale * math.sqrt(WIDTH * HEIGHT * FILL / area), 3))
+    while True:
+        placed, skipped = _layout_all(counts, scale)
+        if not skipped or scale <= MIN_SCALE:
+            break
+        scale = max(MIN_SCALE, round(scale * 0.85, 3))
+    return {'width': WIDTH, 'height': HEIGHT, 'scale': scale, 'words': placed}
+
+
+def render_svg(layout):
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {WIDTH} {HEIGHT}" '
+             f'width="100%" height="100%" font-family="DejaVu Sans, Verdana, sans-serif" font-weight="bold">']
+    for word in layout['words']:
+        text = escape(word['text'])
+        parts.append(
+            f'<text x="{word["x"]}" y="{word["y"]}" font-size="{word["font_size"]}" fill="{word["color"]}" '
+            f'text-anchor="middle" dominant-baseline="central" textLength="{word["w"]}" '
+            f'lengthAdjust="spacingAndGlyphs"><title>{text}: {word["count"]}x genannt</title>{text}</text>')
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def render_png(layout):
+    image = Image.new('RGBA', (WIDTH, HEIGHT), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for word in layout['words']:
+        draw.text((word['x'], word['y']), word['text'], font=_font(word['font_size']),
+                  fill=word['color'], anchor='mm')
+    out = io.BytesIO()
+    image.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+
+class LayoutCache:
+    """Latest layout per cloud, plus its SVG/PNG renders, keyed by cloud version."""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, cloud_id, version, words_fn):
+        with self._lock:
+            entry = self._entries.get(cloud_id)
+            if entry and entry['version'] == version:
+                self._entries.move_to_end(cloud_id)
+                return entry
+            previous = entry['layout'] if entry else None
+
+        layout = build_layout(words_fn(), previous)
+        entry = {'version': version, 'layout': layout, 'svg': None, 'png': None}
+        with self._lock:
+            current = self._entries.get(cloud_id)
+            if current and current['version'] == version:
+                return current
+            self._entries[cloud_id] = entry
+            self._entries.move_to_end(cloud_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def layout(self, cloud_id, version, words_fn):
+        return self._entry(cloud_id, version, words_fn)['layout']
+
+    def svg(self, cloud_id, version, words_fn):
+        entry = self._entry(cloud_id, version, words_fn)
+        if entry['svg'] is None:
+            entry['svg'] = render_svg(entry['layout'])
+        return entry['svg']
+
+    def png(self, cloud_id, version, words_fn):
+        entry = self._entry(cloud_id, version, words_fn)
+        if entry['png'] is None:
+            entry['png'] = render_png(entry['layout'])
+        return entry['png']
+
+    def invalidate(self, cloud_id):
+        with self._lock:
+            self._entries.pop(cloud_id, None)
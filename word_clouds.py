@@ -0,0 +1,44 @@
+"""
+Word cloud aggregation for L8teTools.
+
+Submitted words are counted into `word_cloud_word` (one row per cloud and
+distinct word) in the same transaction that stores the `WordCloudEntry`
+rows, see ingest.py. Serving a cloud therefore costs O(distinct words)
+instead of a GROUP BY over every entry.
+
+Every flush also bumps `WordCloud.version`, so live viewers (see live.py)
+can detect changes with a single-row SELECT, and the data endpoint answers
+unchanged clouds with an empty 304 based on `etag()`.
+"""
+
+from sqlalchemy import text
+
+
+def record_words(session, counts):
+    """Add {(cloud_id, word): n} to the word counts (caller commits)."""
+    for (cloud_id, word), n in counts.items():
+        params = {'id': cloud_id, 'word': word, 'n': n}
+        updated = session.execute(
+            text('UPDATE word_cloud_word SET count = count + :n WHERE word_cloud_id = :id AND word = :word'),
+            params)
+        if updated.rowcount == 0:
+            # Clouds deleted since the submit are skipped
+            session.execute(
+                text('INSERT INTO word_cloud_word (word_cloud_id, word, count) '
+                     'SELECT :id, :word, :n WHERE EXISTS (SELECT 1 FROM word_cloud WHERE id = :id)'),
+                params)
+
+
+def etag(cloud):
+    return f'wc-{cloud.id}-{cloud.version or 0}'
+
+
+def compute_words(session, cloud):
+    rows = session.execute(
+        text('SELECT word, count FROM word_cloud_word WHERE word_cloud_id = :id ORDER BY word'),
+        {'id': cloud.id}).all()
+    return {
+        'title': cloud.title,
+        'description': cloud.description,
+        'words': [{'text': word, 'size': count} for word, count in rows]
+    }
@@ -0,0 +1,59 @@
+"""
+ZIP archives written while they are sent.
+
+The batch branches of /api/convert collected every converted file in an
+`io.BytesIO` ZIP and only then called `send_file`: a 500 MB batch sat in
+RAM twice (entries plus archive), and the browser saw nothing until the
+last file was done. `stream()` turns the `(name, bytes or path)` entries
+of converter.py into chunks of a ZIP file as each entry becomes available.
+
+zipfile can do this on its own: given a file object without `tell()`, it
+writes every entry with a data descriptor (sizes and CRC after the data)
+instead of seeking back to patch the local header. `_Sink` is such an
+object; whatever zipfile wrote is handed out after every entry, or every
+block of an entry read from disk, so at most one entry is held in memory.
+"""
+
+import zipfile
+
+READ_BLOCK = 1024 * 1024
+
+
+class _Sink:
+    """Write-only and unseekable, so zipfile writes data descriptors."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """What was written since the last call, as a list of at most one chunk."""
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return [data] if data else []
+
+
+def stream(entries):
+    """Yield the bytes of a ZIP (stored, like before) holding `entries`."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for name, source in entries:
+            if isinstance(source, bytes):
+                zf.writestr(name, source)
+            else:
+                # The size from stat decides whether the entry needs ZIP64
+                with open(source, 'rb') as src, zf.open(zipfile.ZipInfo.from_file(source, name), 'w') as dest:
+                    while True:
+                        block = src.read(READ_BLOCK)
+                        if not block:
+                            break
+                        dest.write(block)
+                        yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()